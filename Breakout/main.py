@@ -1,7 +1,18 @@
-from graphics import Canvas
+try:
+    from graphics import Canvas
+except ImportError:
+    Canvas = None  # The headless tools (replay, multiball-bench) don't need a window
+import sys
+import json
+import argparse
 import time
 import random
 
+try:
+    import numpy as np
+except ImportError: # Only the multi-ball mode needs NumPy
+    np = None
+
 # --- Canvas and Game Constants ---
 CANVAS_WIDTH = 500
 CANVAS_HEIGHT = 600
@@ -14,10 +25,28 @@ BRICK_ROWS = 10
 BRICKS_PER_ROW = 10
 BRICK_WIDTH = (CANVAS_WIDTH - BRICK_GAP * (BRICKS_PER_ROW - 1)) / BRICKS_PER_ROW
 BRICK_HEIGHT = 10
+BRICK_TOP = 50 # Y position of the first row of bricks
 INITIAL_BALL_SPEED = 10
 GAME_DELAY = 0.01 # Base delay for game loop, adjusted for speed
+MAX_BOUNCES_PER_FRAME = 8 # Collisions resolved within one frame before the rest of the frame is dropped
+COLLISION_EPSILON = 1e-9 # Fraction of a frame below which the ball counts as already touching
 BACKGROUND_CHANGE_DELAY = 0.5 # Delay for background cycling
 
+# --- Multi-ball Mode Constants ---
+MULTIBALL_COUNT = 200
+MULTIBALL_RADIUS = 4
+MULTIBALL_SPEED = 6
+DEBRIS_POOL_SIZE = 600 # Debris sprites created up front and reused
+DEBRIS_PER_BRICK = 6
+DEBRIS_LIFETIME = 40 # Frames a piece of debris stays on screen
+DEBRIS_SIZE = 3
+DEBRIS_GRAVITY = 0.3
+DEBRIS_COLOR = "gray"
+HIDDEN_X = -100 # Where unused sprites wait, off the canvas
+HIDDEN_Y = -100
+MULTIBALL_BENCH_COUNTS = (1, 10, 100, 1000, 10000)
+MULTIBALL_BENCH_FRAMES = 100
+
 # --- Color Palettes ---
 # Start Screen Color Palettes
 START_PALETTES = [
@@ -389,55 +418,178 @@ def wait_for_restart_button_click(canvas, restart_screen_data):
         time.sleep(BACKGROUND_CHANGE_DELAY)
 
 
-def create_bricks(canvas):
+# --- Bricks ---
+
+class BrickGrid:
     """
-    Creates the rows of bricks for the game.
-    Returns a list of brick object IDs.
+    The bricks of a level, laid out on a regular lattice of rows and columns.
+    cells[row][col] holds the brick's canvas ID, or None once it is broken, so
+    the bricks near a point are found by arithmetic instead of a search.
     """
-    bricks = []
-    
-    # Define brick colors for each row
-    # This ensures a consistent color pattern across rows
-    row_colors = [
-        BRICK_COLORS[0], BRICK_COLORS[0], # Red
-        BRICK_COLORS[1], BRICK_COLORS[1], # Orange
-        BRICK_COLORS[2], BRICK_COLORS[2], # Yellow
-        BRICK_COLORS[3], BRICK_COLORS[3], # Green
-        BRICK_COLORS[4], BRICK_COLORS[4]  # Blue
-    ]
-
-    for row in range(BRICK_ROWS):
-        start_y = 50 + row * (BRICK_HEIGHT + BRICK_GAP)
-        brick_color = row_colors[row % len(row_colors)] # Use modulo to cycle through colors if more rows than colors
 
-        for col in range(BRICKS_PER_ROW):
-            start_x = col * (BRICK_WIDTH + BRICK_GAP)
-            brick = canvas.create_rectangle(
-                start_x, start_y,
-                start_x + BRICK_WIDTH, start_y + BRICK_HEIGHT,
-                brick_color, brick_color # Fill and outline
-            )
-            bricks.append(brick)
-    return bricks
-
-def bouncing(canvas, ball_x, ball_y, change_x, change_y):
+    def __init__(self, canvas, rows=BRICK_ROWS, columns=BRICKS_PER_ROW, gap=BRICK_GAP):
+        self.rows = rows
+        self.columns = columns
+        self.brick_width = (CANVAS_WIDTH - gap * (columns - 1)) / columns
+        self.pitch_x = self.brick_width + gap
+        self.pitch_y = BRICK_HEIGHT + gap
+        self.count = 0
+
+        # Define brick colors for each row
+        # This ensures a consistent color pattern across rows
+        row_colors = [
+            BRICK_COLORS[0], BRICK_COLORS[0], # Red
+            BRICK_COLORS[1], BRICK_COLORS[1], # Orange
+            BRICK_COLORS[2], BRICK_COLORS[2], # Yellow
+            BRICK_COLORS[3], BRICK_COLORS[3], # Green
+            BRICK_COLORS[4], BRICK_COLORS[4]  # Blue
+        ]
+
+        self.cells = []
+        for row in range(rows):
+            brick_color = row_colors[row % len(row_colors)] # Use modulo to cycle through colors if more rows than colors
+            cells = []
+            for col in range(columns):
+                left, top, right, bottom = self.bounds(row, col)
+                cells.append(canvas.create_rectangle(left, top, right, bottom, brick_color, brick_color)) # Fill and outline
+            self.cells.append(cells)
+            self.count += columns
+
+    def bounds(self, row, col):
+        """Left, top, right and bottom edges of the brick in a cell."""
+        left = col * self.pitch_x
+        top = BRICK_TOP + row * self.pitch_y
+        return left, top, left + self.brick_width, top + BRICK_HEIGHT
+
+    def bricks_in(self, left, top, right, bottom):
+        """Yields (row, col, brick ID) for every remaining brick whose cell overlaps the area."""
+        first_row = max(int((top - BRICK_TOP) // self.pitch_y), 0)
+        last_row = min(int((bottom - BRICK_TOP) // self.pitch_y), self.rows - 1)
+        first_col = max(int(left // self.pitch_x), 0)
+        last_col = min(int(right // self.pitch_x), self.columns - 1)
+        for row in range(first_row, last_row + 1):
+            cells = self.cells[row]
+            for col in range(first_col, last_col + 1):
+                if cells[col] is not None:
+                    yield row, col, cells[col]
+
+    def remove(self, canvas, row, col):
+        """Breaks the brick in a cell."""
+        canvas.delete(self.cells[row][col])
+        self.cells[row][col] = None
+        self.count -= 1
+
+# --- Collision Detection ---
+# The ball is a circle moving in a straight line during a frame. Each
+# function returns the fraction of the frame (0 to limit) at which it first
+# touches something, plus the surface normal there, so the bounce can be
+# resolved at the exact moment of impact however fast the ball moves.
+
+def sweep_circle_rect(center_x, center_y, change_x, change_y, radius, left, top, right, bottom, limit):
     """
-    Handles ball bouncing off canvas walls.
+    Time of impact of a moving circle with a rectangle, as (t, normal_x, normal_y),
+    or None if they don't touch before `limit`. The rectangle is grown by the
+    radius and hit with a ray; hits near a corner are redone against the
+    rounded corner.
     """
-    if ball_x <= 0 or ball_x + BALL_RADIUS * 2 >= CANVAS_WIDTH:
-        change_x = -change_x
-    if ball_y <= 0:
-        change_y = -change_y
-    return change_x, change_y
-
-def run_game(canvas):
+    t_near, t_far = -float('inf'), float('inf')
+    for position, change, low, high, axis in ((center_x, change_x, left, right, 0),
+                                              (center_y, change_y, top, bottom, 1)):
+        low, high = low - radius, high + radius
+        if change == 0:
+            if not low <= position <= high:
+                return None
+            continue
+        t_low, t_high = (low - position) / change, (high - position) / change
+        if t_low > t_high:
+            t_low, t_high = t_high, t_low
+        if t_low > t_near:
+            t_near, near_axis = t_low, axis
+        t_far = min(t_far, t_high)
+    if t_near > t_far or t_far <= COLLISION_EPSILON or t_near > limit:
+        return None  # Missed, moving away after a bounce, or not this frame
+    inside = t_near < -COLLISION_EPSILON # Already inside the grown box, not just touching it
+    t_near = max(t_near, 0)
+
+    hit_x = center_x + change_x * t_near
+    hit_y = center_y + change_y * t_near
+    corner_x = left if hit_x < left else right if hit_x > right else None
+    corner_y = top if hit_y < top else bottom if hit_y > bottom else None
+    if corner_x is None or corner_y is None:
+        if inside:
+            return None  # Overlapping a side: push_circle_out() should have separated them first
+        if near_axis == 0:
+            return t_near, (-1 if change_x > 0 else 1), 0
+        return t_near, 0, (-1 if change_y > 0 else 1)
+
+    # Ray against the circle of the given radius around the corner
+    offset_x, offset_y = center_x - corner_x, center_y - corner_y
+    a = change_x * change_x + change_y * change_y
+    b = offset_x * change_x + offset_y * change_y
+    c = offset_x * offset_x + offset_y * offset_y - radius * radius
+    discriminant = b * b - a * c
+    if discriminant < 0 or b >= 0:
+        return None  # Passes the corner, or is moving away from it
+    t = (-b - discriminant ** 0.5) / a
+    if t < -COLLISION_EPSILON or t > limit:
+        return None
+    t = max(t, 0)
+    return t, (offset_x + change_x * t) / radius, (offset_y + change_y * t) / radius
+
+def push_circle_out(center_x, center_y, radius, left, top, right, bottom):
+    """
+    How to separate a circle that already overlaps a rectangle, e.g. when the
+    paddle moves onto the ball, as (move_x, move_y, normal_x, normal_y): out
+    through the side it is least deep in. None if they don't overlap.
+    """
+    nearest_x = min(max(center_x, left), right)
+    nearest_y = min(max(center_y, top), bottom)
+    if (center_x - nearest_x) ** 2 + (center_y - nearest_y) ** 2 >= (radius - COLLISION_EPSILON) ** 2:
+        return None  # Apart or just touching, which the sweep handles
+    depth, normal_x, normal_y = min((center_x + radius - left, -1, 0), (right + radius - center_x, 1, 0),
+                                    (center_y + radius - top, 0, -1), (bottom + radius - center_y, 0, 1))
+    return depth * normal_x, depth * normal_y, normal_x, normal_y
+
+def sweep_circle_walls(center_x, center_y, change_x, change_y, radius, limit):
+    """
+    First wall the ball reaches before `limit`, as (t, normal_x, normal_y, is_floor),
+    or None. Reaching the bottom edge costs a life instead of bouncing.
+    """
+    hits = []
+    if change_x < 0:
+        hits.append(((radius - center_x) / change_x, 1, 0, False))
+    elif change_x > 0:
+        hits.append(((CANVAS_WIDTH - radius - center_x) / change_x, -1, 0, False))
+    if change_y < 0:
+        hits.append(((radius - center_y) / change_y, 0, 1, False))
+    elif change_y > 0:
+        hits.append(((CANVAS_HEIGHT - radius - center_y) / change_y, 0, -1, True))
+    hits = [(max(t, 0), normal_x, normal_y, is_floor) for t, normal_x, normal_y, is_floor in hits if t <= limit]
+    return min(hits) if hits else None
+
+def reflect(change_x, change_y, normal_x, normal_y):
+    """Bounce a velocity off a surface with the given unit normal."""
+    dot = change_x * normal_x + change_y * normal_y
+    return change_x - 2 * dot * normal_x, change_y - 2 * dot * normal_y
+
+def run_game(canvas, rows=BRICK_ROWS, columns=BRICKS_PER_ROW, gap=BRICK_GAP, speed=INITIAL_BALL_SPEED,
+             recording=None, replay=None, delay=GAME_DELAY):
     """
     Contains the main game logic for Breakout.
     Returns the final message and score when the game ends.
+    With a GameRecording as `recording`, every tick's paddle input and every
+    broken brick is stored in it; with one as `replay`, the paddle follows the
+    recorded inputs instead of the mouse. `delay` paces the frames (0 = as
+    fast as possible).
     """
+    for game_recording in (recording, replay):
+        if game_recording is not None:
+            random.seed(game_recording.seed)
+            break
+
     # Create bricks
-    bricks = create_bricks(canvas)
-    total_bricks = len(bricks)
+    bricks = BrickGrid(canvas, rows, columns, gap)
+    total_bricks = bricks.count
 
     # Create paddle
     paddle_x = CANVAS_WIDTH / 2 - PADDLE_WIDTH / 2
@@ -449,8 +601,8 @@ def run_game(canvas):
     ball = canvas.create_oval(ball_x, ball_y, ball_x + BALL_RADIUS * 2, ball_y + BALL_RADIUS * 2, BALL_COLOR)
 
     # Ball movement variables
-    change_x = INITIAL_BALL_SPEED
-    change_y = INITIAL_BALL_SPEED
+    change_x = speed
+    change_y = speed
 
     # Game state variables
     lives = 3
@@ -458,14 +610,92 @@ def run_game(canvas):
     points_text = draw_centered_text(canvas, CANVAS_WIDTH / 2, 15, f"{points} POINTS | LIVES: {lives}", 15, 'black')
 
     # Game loop
+    tick = 0
     while True:
-        # Move ball
-        ball_x += change_x
-        ball_y += change_y
+        # Move paddle with mouse (or as recorded)
+        if replay is None:
+            mouse_x = canvas.get_mouse_x()
+        elif tick < len(replay.inputs):
+            mouse_x = replay.inputs[tick]
+        else:
+            raise ValueError(f"The recording ends at tick {tick} before the game does")
+        if recording is not None:
+            recording.inputs.append(mouse_x)
+        # Clamp paddle to canvas bounds
+        paddle_x = max(0, min(mouse_x - PADDLE_WIDTH / 2, CANVAS_WIDTH - PADDLE_WIDTH))
+        canvas.moveto(paddle, paddle_x, PADDLE_Y)
+
+        # If the paddle moved onto the ball, push the ball out and bounce it off
+        overlap = push_circle_out(ball_x + BALL_RADIUS, ball_y + BALL_RADIUS, BALL_RADIUS,
+                                  paddle_x, PADDLE_Y, paddle_x + PADDLE_WIDTH, PADDLE_Y + PADDLE_HEIGHT)
+        if overlap is not None:
+            move_x, move_y, normal_x, normal_y = overlap
+            ball_x = max(0, min(ball_x + move_x, CANVAS_WIDTH - 2 * BALL_RADIUS))
+            ball_y += move_y
+            if change_x * normal_x + change_y * normal_y < 0:
+                change_x, change_y = reflect(change_x, change_y, normal_x, normal_y)
+
+        # Move the ball through the frame, stopping at each impact to bounce
+        remaining = 1.0
+        lost_ball = False
+        for _ in range(MAX_BOUNCES_PER_FRAME):
+            center_x, center_y = ball_x + BALL_RADIUS, ball_y + BALL_RADIUS
+            hit = sweep_circle_walls(center_x, center_y, change_x, change_y, BALL_RADIUS, remaining)
+            hit_brick = None
+            impact = sweep_circle_rect(center_x, center_y, change_x, change_y, BALL_RADIUS,
+                                       paddle_x, PADDLE_Y, paddle_x + PADDLE_WIDTH, PADDLE_Y + PADDLE_HEIGHT, remaining)
+            if impact is not None and (hit is None or impact[0] < hit[0]):
+                hit = impact + (False,)
+
+            # Only bricks in cells the ball can reach this frame
+            end_x, end_y = center_x + change_x * remaining, center_y + change_y * remaining
+            for row, col, brick in bricks.bricks_in(min(center_x, end_x) - BALL_RADIUS, min(center_y, end_y) - BALL_RADIUS,
+                                                    max(center_x, end_x) + BALL_RADIUS, max(center_y, end_y) + BALL_RADIUS):
+                impact = sweep_circle_rect(center_x, center_y, change_x, change_y, BALL_RADIUS,
+                                           *bricks.bounds(row, col), remaining)
+                if impact is not None and (hit is None or impact[0] < hit[0]):
+                    hit = impact + (False,)
+                    hit_brick = (row, col)
+
+            if hit is None:
+                ball_x += change_x * remaining
+                ball_y += change_y * remaining
+                break
+            t, normal_x, normal_y, lost_ball = hit
+            ball_x += change_x * t
+            ball_y += change_y * t
+            remaining -= t
+            if lost_ball:
+                break
+            change_x, change_y = reflect(change_x, change_y, normal_x, normal_y)
+
+            if hit_brick is not None:
+                bricks.remove(canvas, *hit_brick)
+                if recording is not None:
+                    recording.bricks.append((tick,) + hit_brick)
+                points += 20
+                canvas.change_text(points_text, f"{points} POINTS | LIVES: {lives}")
+
+                # Increase speed based on the share of bricks remaining
+                bricks_left = bricks.count / total_bricks
+                if bricks_left <= 0.8 and bricks_left > 0.6:
+                    change_x = (1.2 * speed) * (1 if change_x > 0 else -1)
+                    change_y = (1.2 * speed) * (1 if change_y > 0 else -1)
+                elif bricks_left <= 0.6 and bricks_left > 0.4:
+                    change_x = (1.4 * speed) * (1 if change_x > 0 else -1)
+                    change_y = (1.4 * speed) * (1 if change_y > 0 else -1)
+                elif bricks_left <= 0.4:
+                    change_x = (1.6 * speed) * (1 if change_x > 0 else -1)
+                    change_y = (1.6 * speed) * (1 if change_y > 0 else -1)
+
+                if bricks.count == 0:
+                    # All bricks cleared - Player Wins!
+                    canvas.clear() # Clear all game elements
+                    return "CONGRATULATIONS! YOU WON!", points # Return message and score
         canvas.moveto(ball, ball_x, ball_y)
 
         # Handle ball hitting bottom wall (lose a life)
-        if ball_y + BALL_RADIUS * 2 >= CANVAS_HEIGHT:
+        if lost_ball:
             lives -= 1
             if lives == 0:
                 # Game Over
@@ -478,68 +708,397 @@ def run_game(canvas):
                 canvas.moveto(ball, ball_x, ball_y)
                 # Update lives display
                 canvas.change_text(points_text, f"{points} POINTS | LIVES: {lives}")
-                time.sleep(1) # Pause briefly before next life
+                if delay:
+                    time.sleep(1) # Pause briefly before next life
 
-        # Handle ball bouncing off walls
-        change_x, change_y = bouncing(canvas, ball_x, ball_y, change_x, change_y)
+        tick += 1
+        if delay:
+            time.sleep(delay)
 
-        # Move paddle with mouse
-        mouse_x = canvas.get_mouse_x()
-        # Clamp paddle to canvas bounds
-        new_paddle_x = max(0, min(mouse_x - PADDLE_WIDTH / 2, CANVAS_WIDTH - PADDLE_WIDTH))
-        canvas.moveto(paddle, new_paddle_x, PADDLE_Y)
-
-        # Collision detection
-        # Get all objects overlapping with the ball's current position
-        colliding_list = canvas.find_overlapping(ball_x, ball_y, ball_x + BALL_RADIUS * 2, ball_y + BALL_RADIUS * 2)
-
-        # Check for paddle collision
-        if paddle in colliding_list:
-            # Ensure ball is moving downwards before bouncing off paddle
-            if change_y > 0:
-                change_y = -change_y
-                # Adjust ball position slightly to prevent sticking
-                ball_y = PADDLE_Y - BALL_RADIUS * 2 - 1
-                canvas.moveto(ball, ball_x, ball_y)
+# --- Headless Play, Recording and Replay ---
+# A game is fully determined by its level, its seed and the paddle position
+# on every tick, so a recording of those can be replayed without a window as
+# fast as the CPU allows and must end with the same score and the same bricks
+# broken on the same ticks.
 
-        # Check for brick collision
-        hit_brick = False
-        for obj_id in colliding_list:
-            # Check if the object is a brick (not the paddle or ball itself)
-            if obj_id != ball and obj_id != paddle and obj_id in bricks:
-                canvas.delete(obj_id)
-                bricks.remove(obj_id) # Remove from our list of active bricks
-                points += 20
-                total_bricks -= 1
-                canvas.change_text(points_text, f"{points} POINTS | LIVES: {lives}")
-                hit_brick = True
-                break # Only hit one brick per collision for simplicity
-
-        if hit_brick:
-            change_y = -change_y # Bounce off the brick
-
-            # Increase speed based on remaining bricks
-            if total_bricks <= 80 and total_bricks > 60:
-                change_x = (1.2 * INITIAL_BALL_SPEED) * (1 if change_x > 0 else -1)
-                change_y = (1.2 * INITIAL_BALL_SPEED) * (1 if change_y > 0 else -1)
-            elif total_bricks <= 60 and total_bricks > 40:
-                change_x = (1.4 * INITIAL_BALL_SPEED) * (1 if change_x > 0 else -1)
-                change_y = (1.4 * INITIAL_BALL_SPEED) * (1 if change_y > 0 else -1)
-            elif total_bricks <= 40:
-                change_x = (1.6 * INITIAL_BALL_SPEED) * (1 if change_x > 0 else -1)
-                change_y = (1.6 * INITIAL_BALL_SPEED) * (1 if change_y > 0 else -1)
-
-            if total_bricks == 0:
-                # All bricks cleared - Player Wins!
-                canvas.clear() # Clear all game elements
-                return "CONGRATULATIONS! YOU WON!", points # Return message and score
+class HeadlessCanvas:
+    """
+    Stands in for the graphics Canvas when nothing needs to be shown, so the
+    game can be timed without a window. Drawing calls just hand out IDs.
+    """
+
+    def __init__(self):
+        self.next_id = 0
+        self.mouse_x = CANVAS_WIDTH / 2
+
+    def new_object(self, *args, **kwargs):
+        self.next_id += 1
+        return self.next_id
+
+    create_rectangle = create_oval = create_text = new_object
+
+    def moveto(self, object_id, x, y):
+        pass
+
+    def delete(self, object_id):
+        pass
+
+    def change_text(self, object_id, text):
+        pass
+
+    def set_color(self, object_id, color):
+        pass
+
+    def clear(self):
+        pass
+
+    def get_mouse_x(self):
+        return self.mouse_x
+
+class GameRecording:
+    """The settings, seed and per-tick paddle input of one game, plus what came of them."""
+
+    def __init__(self, seed=None, rows=BRICK_ROWS, columns=BRICKS_PER_ROW, gap=BRICK_GAP, speed=INITIAL_BALL_SPEED):
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rows = rows
+        self.columns = columns
+        self.gap = gap
+        self.speed = speed
+        self.inputs = [] # Paddle (mouse) x position on each tick
+        self.bricks = [] # (tick, row, col) of every brick broken, in order
+        self.message = None
+        self.score = None
+
+    def save(self, path):
+        """Writes the recording as JSON."""
+        with open(path, "w") as output:
+            json.dump({"seed": self.seed, "rows": self.rows, "columns": self.columns, "gap": self.gap,
+                       "speed": self.speed, "message": self.message, "score": self.score,
+                       "inputs": self.inputs, "bricks": self.bricks}, output)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a recording written by save()."""
+        with open(path) as source:
+            data = json.load(source)
+        recording = cls(data["seed"], data["rows"], data["columns"], data["gap"], data["speed"])
+        recording.inputs = data["inputs"]
+        recording.bricks = [tuple(brick) for brick in data["bricks"]]
+        recording.message = data["message"]
+        recording.score = data["score"]
+        return recording
+
+def play_recorded(canvas, recording, replay=None, delay=GAME_DELAY):
+    """Runs one game with the recording's settings, filling in the recording."""
+    message, score = run_game(canvas, recording.rows, recording.columns, recording.gap, recording.speed,
+                              recording=recording, replay=replay, delay=delay)
+    recording.message, recording.score = message, score
+    return message, score
+
+def record_game(path, seed=None):
+    """Plays a game in a window and saves its recording."""
+    recording = GameRecording(seed)
+    message, score = play_recorded(Canvas(CANVAS_WIDTH, CANVAS_HEIGHT), recording)
+    recording.save(path)
+    print(f"{message} Score: {score}. Recorded {len(recording.inputs)} ticks to {path}")
+
+def replay_game(path, repeat=1):
+    """
+    Replays a recording headlessly, checks that it ends the same way and
+    reports the simulation speed. Returns True if every run matched.
+    """
+    original = GameRecording.load(path)
+    matched = True
+    for run in range(repeat):
+        replayed = GameRecording(original.seed, original.rows, original.columns, original.gap, original.speed)
+        start = time.perf_counter()
+        try:
+            message, score = play_recorded(HeadlessCanvas(), replayed, replay=original, delay=0)
+        except ValueError:
+            # The inputs ran out with the game still going, so it went differently somewhere
+            matched = False
+            diverged = next((index for index, (expected, actual) in enumerate(zip(original.bricks, replayed.bricks))
+                             if expected != actual), min(len(original.bricks), len(replayed.bricks)))
+            print(f"Run {run + 1}: still playing after all {len(original.inputs)} recorded ticks, expected "
+                  f"{original.message} Score: {original.score}; {len(replayed.bricks)} of {len(original.bricks)} "
+                  f"bricks broken, first difference at brick {diverged + 1}: (tick, row, col) "
+                  f"{original.bricks[diverged] if diverged < len(original.bricks) else None} expected, "
+                  f"{replayed.bricks[diverged] if diverged < len(replayed.bricks) else None} replayed")
+            continue
+        seconds = time.perf_counter() - start
+        same = ((message, score, replayed.bricks) == (original.message, original.score, original.bricks)
+                and len(replayed.inputs) == len(original.inputs))
+        matched = matched and same
+        print(f"Run {run + 1}: {message} Score: {score}, {len(replayed.inputs)} ticks in {seconds:.3f}s "
+              f"({len(replayed.inputs) / seconds:.0f} ticks/s), {'matches' if same else 'DIFFERS FROM'} the recording")
+    return matched
+
+# --- Multi-ball Mode ---
+# Hundreds of balls at once: positions and velocities live in NumPy arrays
+# and every frame is a handful of whole-array operations. Balls are small
+# and move less than their radius per sub-step, so overlap tests against the
+# 3x3 grid cells around each ball are enough to catch every brick.
+
+class MultiBall:
+    """
+    Balls and brick debris for the multi-ball mode, one array per property.
+    step() advances the simulation and draw() sends the new positions to the
+    canvas in a single pass at the end of the frame.
+    """
 
+    def __init__(self, canvas, count=MULTIBALL_COUNT, rows=BRICK_ROWS, columns=BRICKS_PER_ROW, gap=BRICK_GAP, seed=None):
+        self.canvas = canvas
+        self.rng = np.random.default_rng(seed)
+        self.bricks = BrickGrid(canvas, rows, columns, gap)
+        self.occupied = np.ones((rows, columns), dtype=bool)
+        self.bricks_bottom = BRICK_TOP + rows * self.bricks.pitch_y
+        self.points = 0
+
+        self.paddle_x = CANVAS_WIDTH / 2 - PADDLE_WIDTH / 2
+        self.paddle = canvas.create_rectangle(self.paddle_x, PADDLE_Y, self.paddle_x + PADDLE_WIDTH,
+                                              PADDLE_Y + PADDLE_HEIGHT, PADDLE_COLOR)
+
+        # Balls start between the bricks and the paddle, heading upwards
+        self.x = self.rng.uniform(MULTIBALL_RADIUS, CANVAS_WIDTH - MULTIBALL_RADIUS, count)
+        self.y = self.rng.uniform(self.bricks_bottom + 2 * MULTIBALL_RADIUS, PADDLE_Y - 2 * MULTIBALL_RADIUS, count)
+        angle = self.rng.uniform(-0.85 * np.pi, -0.15 * np.pi, count)
+        self.change_x = MULTIBALL_SPEED * np.cos(angle)
+        self.change_y = MULTIBALL_SPEED * np.sin(angle)
+        self.alive = np.ones(count, dtype=bool)
+        self.ball_ids = [canvas.create_oval(x - MULTIBALL_RADIUS, y - MULTIBALL_RADIUS,
+                                            x + MULTIBALL_RADIUS, y + MULTIBALL_RADIUS, BALL_COLOR)
+                         for x, y in zip(self.x.tolist(), self.y.tolist())]
+        self.drawn_balls = np.rint(np.stack([self.x, self.y], axis=1) - MULTIBALL_RADIUS).astype(int)
+
+        # Debris is a fixed pool; a piece with no life left is parked off the canvas
+        self.debris_x = np.full(DEBRIS_POOL_SIZE, float(HIDDEN_X))
+        self.debris_y = np.full(DEBRIS_POOL_SIZE, float(HIDDEN_Y))
+        self.debris_change_x = np.zeros(DEBRIS_POOL_SIZE)
+        self.debris_change_y = np.zeros(DEBRIS_POOL_SIZE)
+        self.debris_life = np.zeros(DEBRIS_POOL_SIZE, dtype=int)
+        self.debris_next = 0
+        self.debris_ids = [canvas.create_rectangle(HIDDEN_X, HIDDEN_Y, HIDDEN_X + DEBRIS_SIZE, HIDDEN_Y + DEBRIS_SIZE,
+                                                   DEBRIS_COLOR, DEBRIS_COLOR)
+                           for _ in range(DEBRIS_POOL_SIZE)]
+        self.drawn_debris = np.full((DEBRIS_POOL_SIZE, 2), (HIDDEN_X, HIDDEN_Y))
+
+    def step(self, mouse_x):
+        """Advances one frame: paddle, balls, bricks and debris."""
+        self.paddle_x = max(0, min(mouse_x - PADDLE_WIDTH / 2, CANVAS_WIDTH - PADDLE_WIDTH))
+        substeps = max(1, int(np.ceil(MULTIBALL_SPEED / MULTIBALL_RADIUS)))
+        for _ in range(substeps):
+            self.move_balls(1 / substeps)
+            self.collide_bricks()
+        self.move_debris()
+
+    def move_balls(self, fraction):
+        """Moves every live ball and bounces it off the walls and the paddle."""
+        x, y, change_x, change_y, alive = self.x, self.y, self.change_x, self.change_y, self.alive
+        x += np.where(alive, change_x * fraction, 0)
+        y += np.where(alive, change_y * fraction, 0)
+
+        left = x < MULTIBALL_RADIUS
+        x[left] = 2 * MULTIBALL_RADIUS - x[left]
+        change_x[left] = np.abs(change_x[left])
+        right = x > CANVAS_WIDTH - MULTIBALL_RADIUS
+        x[right] = 2 * (CANVAS_WIDTH - MULTIBALL_RADIUS) - x[right]
+        change_x[right] = -np.abs(change_x[right])
+        top = y < MULTIBALL_RADIUS
+        y[top] = 2 * MULTIBALL_RADIUS - y[top]
+        change_y[top] = np.abs(change_y[top])
+
+        on_paddle = (alive & (change_y > 0) & (y + MULTIBALL_RADIUS >= PADDLE_Y)
+                     & (y - MULTIBALL_RADIUS <= PADDLE_Y + PADDLE_HEIGHT)
+                     & (x + MULTIBALL_RADIUS >= self.paddle_x)
+                     & (x - MULTIBALL_RADIUS <= self.paddle_x + PADDLE_WIDTH))
+        change_y[on_paddle] = -change_y[on_paddle]
+
+        # A ball reaching the bottom edge is gone for good
+        alive &= y < CANVAS_HEIGHT - MULTIBALL_RADIUS
+
+    def collide_bricks(self):
+        """Bounces balls off the bricks they overlap and breaks those bricks."""
+        bricks = self.bricks
+        balls = np.flatnonzero(self.alive & (self.y + MULTIBALL_RADIUS >= BRICK_TOP)
+                               & (self.y - MULTIBALL_RADIUS <= self.bricks_bottom))
+        if len(balls) == 0:
+            return
+        x, y = self.x[balls], self.y[balls]
+        ball_row = np.floor((y - BRICK_TOP) / bricks.pitch_y).astype(int)
+        ball_col = np.floor(x / bricks.pitch_x).astype(int)
+
+        # Deepest overlap among the 3x3 cells around each ball
+        depth = np.zeros(len(balls))
+        hit_cell = np.full(len(balls), -1)
+        offset_x = np.zeros(len(balls))
+        offset_y = np.zeros(len(balls))
+        for row_step in (-1, 0, 1):
+            for col_step in (-1, 0, 1):
+                row, col = ball_row + row_step, ball_col + col_step
+                inside = (row >= 0) & (row < bricks.rows) & (col >= 0) & (col < bricks.columns)
+                row, col = np.where(inside, row, 0), np.where(inside, col, 0)
+                left, top = col * bricks.pitch_x, BRICK_TOP + row * bricks.pitch_y
+                cell_x = x - np.clip(x, left, left + bricks.brick_width)
+                cell_y = y - np.clip(y, top, top + BRICK_HEIGHT)
+                cell_depth = MULTIBALL_RADIUS ** 2 - (cell_x ** 2 + cell_y ** 2)
+                deeper = inside & self.occupied[row, col] & (cell_depth > depth)
+                depth[deeper] = cell_depth[deeper]
+                hit_cell[deeper] = (row * bricks.columns + col)[deeper]
+                offset_x[deeper] = cell_x[deeper]
+                offset_y[deeper] = cell_y[deeper]
+
+        hit = hit_cell >= 0
+        if not hit.any():
+            return
+        balls, offset_x, offset_y = balls[hit], offset_x[hit], offset_y[hit]
+        # Bounce off the side the ball is nearest to, if it is still moving into it
+        side = np.abs(offset_x) > np.abs(offset_y)
+        flip_x = side & (self.change_x[balls] * offset_x < 0)
+        flip_y = ~side & (self.change_y[balls] * offset_y <= 0)
+        self.change_x[balls[flip_x]] *= -1
+        self.change_y[balls[flip_y]] *= -1
+
+        broken = np.unique(hit_cell[hit])
+        self.occupied.flat[broken] = False
+        for cell in broken.tolist():
+            row, col = divmod(cell, bricks.columns)
+            left, top, right, bottom = bricks.bounds(row, col)
+            bricks.remove(self.canvas, row, col)
+            self.spawn_debris((left + right) / 2, (top + bottom) / 2)
+        self.points += 20 * len(broken)
+
+    def spawn_debris(self, center_x, center_y):
+        """Throws pieces of a broken brick out from its center, reusing the oldest pool slots."""
+        slots = (self.debris_next + np.arange(DEBRIS_PER_BRICK)) % DEBRIS_POOL_SIZE
+        self.debris_next = (self.debris_next + DEBRIS_PER_BRICK) % DEBRIS_POOL_SIZE
+        self.debris_x[slots] = center_x
+        self.debris_y[slots] = center_y
+        self.debris_change_x[slots] = self.rng.uniform(-3, 3, DEBRIS_PER_BRICK)
+        self.debris_change_y[slots] = self.rng.uniform(-4, 1, DEBRIS_PER_BRICK)
+        self.debris_life[slots] = DEBRIS_LIFETIME
+
+    def move_debris(self):
+        """Moves live debris under gravity and parks pieces whose time is up."""
+        live = self.debris_life > 0
+        self.debris_change_y[live] += DEBRIS_GRAVITY
+        self.debris_x[live] += self.debris_change_x[live]
+        self.debris_y[live] += self.debris_change_y[live]
+        self.debris_life[live] -= 1
+        expired = live & (self.debris_life == 0)
+        self.debris_x[expired] = HIDDEN_X
+        self.debris_y[expired] = HIDDEN_Y
+
+    def draw(self):
+        """Moves every sprite that changed pixel position since the last frame, in one pass."""
+        canvas = self.canvas
+        canvas.moveto(self.paddle, self.paddle_x, PADDLE_Y)
+        balls = np.rint(np.stack([self.x, self.y], axis=1) - MULTIBALL_RADIUS).astype(int)
+        balls[~self.alive] = (HIDDEN_X, HIDDEN_Y)
+        debris = np.rint(np.stack([self.debris_x, self.debris_y], axis=1)).astype(int)
+        for ids, positions, drawn in ((self.ball_ids, balls, self.drawn_balls),
+                                      (self.debris_ids, debris, self.drawn_debris)):
+            moved = np.flatnonzero((positions != drawn).any(axis=1))
+            for index, (x, y) in zip(moved.tolist(), positions[moved].tolist()):
+                canvas.moveto(ids[index], x, y)
+            drawn[moved] = positions[moved]
+
+    def balls_left(self):
+        """Number of balls still in play."""
+        return int(np.count_nonzero(self.alive))
+
+def run_multiball(canvas, count=MULTIBALL_COUNT, rows=BRICK_ROWS, columns=BRICKS_PER_ROW, gap=BRICK_GAP, seed=None):
+    """
+    Multi-ball Breakout: no lives, the game ends when every ball is lost
+    or every brick is broken. Returns the final message and score.
+    """
+    game = MultiBall(canvas, count, rows, columns, gap, seed)
+    status = f"{game.points} POINTS | BALLS: {game.balls_left()}"
+    points_text = draw_centered_text(canvas, CANVAS_WIDTH / 2, 15, status, 15, 'black')
+    while True:
+        game.step(canvas.get_mouse_x())
+        game.draw()
+        new_status = f"{game.points} POINTS | BALLS: {game.balls_left()}"
+        if new_status != status:
+            canvas.change_text(points_text, new_status)
+            status = new_status
+        if game.bricks.count == 0:
+            canvas.clear()
+            return "CONGRATULATIONS! YOU WON!", game.points
+        if game.balls_left() == 0:
+            canvas.clear()
+            return "GAME OVER!", game.points
         time.sleep(GAME_DELAY)
 
+def run_multiball_benchmark(counts=MULTIBALL_BENCH_COUNTS, frames=MULTIBALL_BENCH_FRAMES, seed=1):
+    """Prints the time per frame of the multi-ball mode as the number of balls grows."""
+    for count in counts:
+        canvas = HeadlessCanvas()
+        game = MultiBall(canvas, count, seed=seed)
+        step_seconds = draw_seconds = 0
+        for _ in range(frames):
+            # Keep the paddle under the balls so most of them stay in play
+            canvas.mouse_x = float(np.mean(game.x[game.alive])) if game.alive.any() else CANVAS_WIDTH / 2
+            start = time.perf_counter()
+            game.step(canvas.get_mouse_x())
+            middle = time.perf_counter()
+            game.draw()
+            step_seconds += middle - start
+            draw_seconds += time.perf_counter() - middle
+        print(f"{count:>6} balls: {1000 * (step_seconds + draw_seconds) / frames:7.3f} ms/frame "
+              f"(physics {1000 * step_seconds / frames:.3f} ms, canvas {1000 * draw_seconds / frames:.3f} ms), "
+              f"{game.balls_left()} balls left, {game.bricks.count} bricks left")
+
+def run_tools(argv):
+    """Entry point for the command line modes."""
+    parser = argparse.ArgumentParser(prog="main.py", description="Breakout extras.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    multiball_parser = commands.add_parser("multiball", help="Play with many balls at once.")
+    multiball_parser.add_argument("--balls", type=int, default=MULTIBALL_COUNT,
+                                  help=f"Number of balls (default {MULTIBALL_COUNT}).")
+    multiball_parser.add_argument("--seed", type=int, help="Seed for the starting positions.")
+
+    record_parser = commands.add_parser("record", help="Play a game and save its inputs for replay.")
+    record_parser.add_argument("path", help="Recording file to write (JSON).")
+    record_parser.add_argument("--seed", type=int, help="Random seed for the game (default: a random one).")
+
+    replay_parser = commands.add_parser("replay", help="Re-run a recording without a window, as fast as possible.")
+    replay_parser.add_argument("path", help="Recording file to read.")
+    replay_parser.add_argument("--repeat", type=int, default=1, help="Number of replays to time (default 1).")
+
+    bench_parser = commands.add_parser("multiball-bench", help="Time multi-ball frames as the ball count grows.")
+    bench_parser.add_argument("--balls", default=None,
+                              help=f"Comma-separated ball counts (default {','.join(map(str, MULTIBALL_BENCH_COUNTS))}).")
+    bench_parser.add_argument("--frames", type=int, default=MULTIBALL_BENCH_FRAMES,
+                              help=f"Frames per count (default {MULTIBALL_BENCH_FRAMES}).")
+
+    args = parser.parse_args(argv)
+    if args.command in ("record", "multiball") and Canvas is None:
+        print("This mode opens a game window and needs the graphics module.")
+        return 1
+    if args.command == "record":
+        record_game(args.path, args.seed)
+        return 0
+    if args.command == "replay":
+        return 0 if replay_game(args.path, args.repeat) else 1
+    if np is None:
+        print("The multi-ball mode needs NumPy (pip install numpy).")
+        return 1
+    if args.command == "multiball":
+        message, score = run_multiball(Canvas(CANVAS_WIDTH, CANVAS_HEIGHT), args.balls, seed=args.seed)
+        print(f"{message} Score: {score}")
+    elif args.command == "multiball-bench":
+        counts = [int(count) for count in args.balls.split(",")] if args.balls else MULTIBALL_BENCH_COUNTS
+        run_multiball_benchmark(counts, args.frames)
+    return 0
+
 def main():
     """
     Main function to initialize the canvas and manage the game flow.
     """
+    if Canvas is None:
+        print("The game needs the graphics module to open its window.")
+        return
     canvas = Canvas(CANVAS_WIDTH, CANVAS_HEIGHT)
 
     # Outer loop to allow restarting the game
@@ -564,4 +1123,6 @@ def main():
         # The canvas is cleared by the restart button click handler before returning here.
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(run_tools(sys.argv[1:]))
     main()
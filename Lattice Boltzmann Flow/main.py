@@ -1,6 +1,13 @@
-from graphics import Canvas
+try:
+    from graphics import Canvas
+except ImportError:
+    Canvas = None  # The headless benchmarks don't need a window
+import sys
 import math
+import time
 import random
+import argparse
+import numpy as np
 
 CANVAS_WIDTH = 400
 CANVAS_HEIGHT = 400
@@ -12,53 +19,263 @@ CYLINDER_CENTER_X = CANVAS_WIDTH // 4
 CYLINDER_CENTER_Y = CANVAS_HEIGHT // 2
 WAKE_LENGTH = 60
 STREAMLINE_STEP = 4
+TRAIL_LENGTH = 40 # Segments kept per streamline; older ones are deleted from the canvas
+DRAWN_PARTICLE_LIMIT = 500 # Particles beyond this are simulated but not drawn
+JITTER = 0.2 # Largest random nudge per frame, in pixels
+FIELD_GRID_SPACING = 0 # Pixels between samples of the potential flow for interpolation; 0 evaluates the formula (see field-bench)
+
+# Lattice Boltzmann solver
+FLOW_MODEL = "lattice" # "lattice" (D2Q9 solver) or "potential" (analytic flow past a cylinder)
+LATTICE_SCALE = 2 # Canvas pixels per lattice cell
+LATTICE_INLET_VELOCITY = 0.1 # Inflow speed in lattice units (cells per step); keep well under 0.3
+REYNOLDS_NUMBER = 100
+LATTICE_STEPS_PER_FRAME = 4
+MLUPS_REPORT_FRAMES = 100 # Print the solver speed every this many frames
+BENCHMARK_GRIDS = ((100, 100), (200, 200), (400, 400), (800, 800))
+BENCHMARK_STEPS = 100
+PARTICLE_BENCHMARK_COUNTS = (200, 2000, 20000, 50000, 100000)
+PARTICLE_BENCHMARK_FRAMES = 20
+FIELD_BENCHMARK_SPACINGS = (1, 2, 4, 8, 16)
+FIELD_BENCHMARK_SAMPLES = 100000
 
 STREAMLINE_COLORS = [
     "red", "orange", "yellow", "green", "cyan", "blue", "magenta"
 ]
 
+# D2Q9 lattice: the rest velocity, the four axis directions and the four diagonals
+LATTICE_X = np.array([0, 1, 0, -1, 0, 1, -1, -1, 1])
+LATTICE_Y = np.array([0, 0, 1, 0, -1, 1, 1, -1, -1])
+LATTICE_WEIGHTS = np.array([4 / 9] + [1 / 9] * 4 + [1 / 36] * 4)
+OPPOSITE_DIRECTION = np.array([0, 3, 4, 1, 2, 7, 8, 5, 6])
+LEFTWARD_DIRECTIONS = np.array([3, 6, 7])
+
+
+def potential_flow_velocity(x, y):
+    """Analytic velocity (pixels per frame) of ideal flow past the cylinder, damped in its wake."""
+    dx = FLOW_VELOCITY
+    dy = 0
+
+    rx = x - CYLINDER_CENTER_X
+    ry = y - CYLINDER_CENTER_Y
+    r = math.hypot(rx, ry)
+
+    if r > CYLINDER_RADIUS:
+        theta = math.atan2(ry, rx)
+        u_r = FLOW_VELOCITY * (1 - (CYLINDER_RADIUS ** 2) / (r ** 2)) * math.cos(theta)
+        u_theta = -FLOW_VELOCITY * (1 + (CYLINDER_RADIUS ** 2) / (r ** 2)) * math.sin(theta)
+
+        dx = u_r * math.cos(theta) - u_theta * math.sin(theta)
+        dy = u_r * math.sin(theta) + u_theta * math.cos(theta)
+
+        if CYLINDER_CENTER_X < x < CYLINDER_CENTER_X + WAKE_LENGTH and abs(y - CYLINDER_CENTER_Y) < CYLINDER_RADIUS:
+            dx *= 0.5
+            dy *= 0.5
+    return dx, dy
+
+
+def potential_flow_velocities(x, y):
+    """potential_flow_velocity for whole arrays of positions at once."""
+    rx = x - CYLINDER_CENTER_X
+    ry = y - CYLINDER_CENTER_Y
+    r_squared = rx ** 2 + ry ** 2
+    outside = r_squared > CYLINDER_RADIUS ** 2
+    # The polar formula in Cartesian form, which needs no trigonometry
+    scale = CYLINDER_RADIUS ** 2 / np.where(outside, r_squared, 1) ** 2
+    dx = np.where(outside, FLOW_VELOCITY * (1 - scale * (rx ** 2 - ry ** 2)), FLOW_VELOCITY)
+    dy = np.where(outside, -2 * FLOW_VELOCITY * scale * rx * ry, 0.0)
+
+    wake = outside & (rx > 0) & (x < CYLINDER_CENTER_X + WAKE_LENGTH) & (np.abs(ry) < CYLINDER_RADIUS)
+    damping = np.where(wake, 0.5, 1.0)
+    return dx * damping, dy * damping
+
+
+class VelocityGrid:
+    """
+    A velocity field sampled at the nodes of a regular grid, read back at any
+    position by bilinear interpolation. Node (row, col) sits at
+    (origin + col * spacing, origin + row * spacing); positions past the
+    edge nodes take the edge values.
+    """
+
+    def __init__(self, velocity_x, velocity_y, spacing, origin=0.0):
+        self.velocity_x = velocity_x
+        self.velocity_y = velocity_y
+        self.spacing = spacing
+        self.origin = origin
+        self.rows, self.cols = velocity_x.shape
+        # Per cell, each component as a + b * right + (c + d * right) * down, so a
+        # lookup gathers the cell's 8 numbers in one go
+        coefficients = []
+        for velocity in (velocity_x, velocity_y):
+            top_left, top_right = velocity[:-1, :-1], velocity[:-1, 1:]
+            bottom_left, bottom_right = velocity[1:, :-1], velocity[1:, 1:]
+            coefficients += [top_left, top_right - top_left, bottom_left - top_left,
+                             bottom_right - bottom_left - top_right + top_left]
+        self.coefficients = np.stack(coefficients).reshape(8, -1)
+
+    @classmethod
+    def from_function(cls, flow_velocities, spacing):
+        """Samples a vectorized velocity function over the whole canvas."""
+        cols = int(np.ceil(CANVAS_WIDTH / spacing)) + 1
+        rows = int(np.ceil(CANVAS_HEIGHT / spacing)) + 1
+        y, x = np.mgrid[0:rows, 0:cols] * float(spacing)
+        velocity_x, velocity_y = flow_velocities(x, y)
+        return cls(velocity_x, velocity_y, spacing)
+
+    def velocities_at(self, x, y):
+        """Interpolated velocity at arrays of positions."""
+        # Stop just short of the last node so every position has a cell to its bottom right
+        grid_x = np.clip((x - self.origin) * (1 / self.spacing), 0, self.cols - 1 - 1e-9)
+        grid_y = np.clip((y - self.origin) * (1 / self.spacing), 0, self.rows - 1 - 1e-9)
+        col = grid_x.astype(int)
+        row = grid_y.astype(int)
+        right = grid_x - col
+        down = grid_y - row
+        a, b, c, d, a_y, b_y, c_y, d_y = self.coefficients.take(row * (self.cols - 1) + col, axis=1)
+        return a + b * right + (c + d * right) * down, a_y + b_y * right + (c_y + d_y * right) * down
+
+
+class LatticeBoltzmann:
+    """
+    D2Q9 lattice Boltzmann solver with BGK collisions for flow past the
+    cylinder. The distributions are a (9, ny, nx) array and every step is a
+    few whole-array operations: stream, bounce back off the cylinder, collide.
+    Flow enters on the left at a fixed velocity, leaves on the right, and the
+    top and bottom edges wrap around.
+    """
+
+    def __init__(self, nx, ny, scale=LATTICE_SCALE, inlet_velocity=LATTICE_INLET_VELOCITY, reynolds=REYNOLDS_NUMBER):
+        self.nx = nx
+        self.ny = ny
+        self.scale = scale
+        self.inlet_velocity = inlet_velocity
+        self.steps = 0
+        self.seconds = 0.0
+
+        # Cylinder mask, at the canvas position of the drawn cylinder
+        cell_x = (np.arange(nx) + 0.5) * scale
+        cell_y = (np.arange(ny) + 0.5) * scale
+        self.solid = np.hypot(cell_x[np.newaxis, :] - CYLINDER_CENTER_X,
+                              cell_y[:, np.newaxis] - CYLINDER_CENTER_Y) <= CYLINDER_RADIUS
+
+        # Relaxation time from the viscosity that gives the Reynolds number
+        viscosity = inlet_velocity * (2 * CYLINDER_RADIUS / scale) / reynolds
+        self.tau = 3 * viscosity + 0.5
+
+        # Start from uniform flow with a slight vertical wobble so the wake can start shedding
+        velocity_x = np.full((ny, nx), inlet_velocity)
+        velocity_y = 0.01 * inlet_velocity * np.sin(2 * np.pi * np.arange(nx) / nx)[np.newaxis, :].repeat(ny, axis=0)
+        velocity_x[self.solid] = 0
+        velocity_y[self.solid] = 0
+        self.f = self.equilibrium(np.ones((ny, nx)), velocity_x, velocity_y)
+        self.inlet = self.equilibrium(np.ones(ny), np.full(ny, inlet_velocity), np.zeros(ny))
+        self.update_velocity()
+
+    @staticmethod
+    def equilibrium(density, velocity_x, velocity_y):
+        """Equilibrium distributions for the given density and velocity, shape (9,) + density.shape."""
+        f = np.empty((9,) + density.shape)
+        base = 1 - 1.5 * (velocity_x ** 2 + velocity_y ** 2)
+        f[0] = LATTICE_WEIGHTS[0] * density * base
+        # Opposite directions share the projected velocity with the sign flipped
+        for direction, projected in ((1, 3 * velocity_x), (2, 3 * velocity_y),
+                                     (5, 3 * (velocity_x + velocity_y)), (6, 3 * (velocity_y - velocity_x))):
+            weighted = LATTICE_WEIGHTS[direction] * density
+            even = weighted * (base + 0.5 * projected ** 2)
+            odd = weighted * projected
+            f[direction] = even + odd
+            f[OPPOSITE_DIRECTION[direction]] = even - odd
+        return f
+
+    def step(self, count=1):
+        """Advances the flow by `count` lattice time steps."""
+        start = time.perf_counter()
+        f = self.f
+        for _ in range(count):
+            # Outflow: the right column takes its left-moving populations from its neighbour
+            f[LEFTWARD_DIRECTIONS, :, -1] = f[LEFTWARD_DIRECTIONS, :, -2]
+
+            # Streaming
+            for direction in range(9):
+                f[direction] = np.roll(f[direction], (LATTICE_Y[direction], LATTICE_X[direction]), axis=(0, 1))
+
+            # Populations that streamed into the cylinder go back the way they came
+            bounced = f[:, self.solid][OPPOSITE_DIRECTION]
+
+            # BGK collision towards equilibrium
+            density = f.sum(axis=0)
+            velocity_x = np.tensordot(LATTICE_X, f, axes=1) / density
+            velocity_y = np.tensordot(LATTICE_Y, f, axes=1) / density
+            f *= 1 - 1 / self.tau
+            f += self.equilibrium(density, velocity_x, velocity_y) / self.tau
+
+            f[:, self.solid] = bounced
+            f[:, :, 0] = self.inlet
+        self.steps += count
+        self.update_velocity()
+        self.seconds += time.perf_counter() - start
+
+    def update_velocity(self):
+        """Recomputes the macroscopic velocity used to move the particles."""
+        density = self.f.sum(axis=0)
+        self.velocity_x = np.tensordot(LATTICE_X, self.f, axes=1) / density
+        self.velocity_y = np.tensordot(LATTICE_Y, self.f, axes=1) / density
+        self.velocity_x[self.solid] = 0
+        self.velocity_y[self.solid] = 0
+        # The same field in pixels per frame, with its nodes at the cell centers
+        to_pixels = FLOW_VELOCITY / self.inlet_velocity
+        self.grid = VelocityGrid(self.velocity_x * to_pixels, self.velocity_y * to_pixels, self.scale, self.scale / 2)
+
+    def mlups(self):
+        """Million lattice cell updates per second so far."""
+        return self.nx * self.ny * self.steps / self.seconds / 1e6 if self.seconds else 0.0
+
+    def velocity_at(self, x, y):
+        """Flow velocity in pixels per frame at a canvas position (nearest lattice cell)."""
+        col = min(max(int(x / self.scale), 0), self.nx - 1)
+        row = min(max(int(y / self.scale), 0), self.ny - 1)
+        to_pixels = FLOW_VELOCITY / self.inlet_velocity
+        return float(self.velocity_x[row, col]) * to_pixels, float(self.velocity_y[row, col]) * to_pixels
+
+    def velocities_at(self, x, y):
+        """Flow velocity at arrays of positions, interpolated between cell centers."""
+        return self.grid.velocities_at(x, y)
+
+
 class Particle:
     def __init__(self, x, y):
         self.x = x
         self.y = y
         self.oval = None
-        self.path = []
+        self.trail = [None] * TRAIL_LENGTH # Ring buffer of the streamline's line IDs
+        self.trail_next = 0 # Slot holding the oldest segment, overwritten next
+        self.trail_start = (x, y) # Where the next segment starts, or None after a respawn
         self.color_index = random.randint(0, len(STREAMLINE_COLORS) - 1)
 
-    def update(self, canvas):
-        dx = FLOW_VELOCITY
-        dy = 0
-
-        rx = self.x - CYLINDER_CENTER_X
-        ry = self.y - CYLINDER_CENTER_Y
-        r = math.hypot(rx, ry)
-
-        if r > CYLINDER_RADIUS:
-            theta = math.atan2(ry, rx)
-            u_r = FLOW_VELOCITY * (1 - (CYLINDER_RADIUS ** 2) / (r ** 2)) * math.cos(theta)
-            u_theta = -FLOW_VELOCITY * (1 + (CYLINDER_RADIUS ** 2) / (r ** 2)) * math.sin(theta)
+    def update(self, canvas, flow_velocity=potential_flow_velocity):
+        self.move(flow_velocity)
+        self.draw(canvas)
 
-            dx = u_r * math.cos(theta) - u_theta * math.sin(theta)
-            dy = u_r * math.sin(theta) + u_theta * math.cos(theta)
+    def move(self, flow_velocity=potential_flow_velocity):
+        dx, dy = flow_velocity(self.x, self.y)
 
-            if CYLINDER_CENTER_X < self.x < CYLINDER_CENTER_X + WAKE_LENGTH and abs(self.y - CYLINDER_CENTER_Y) < CYLINDER_RADIUS:
-                dx *= 0.5
-                dy *= 0.5
-
-        dx += random.uniform(-0.2, 0.2)
-        dy += random.uniform(-0.2, 0.2)
+        dx += random.uniform(-JITTER, JITTER)
+        dy += random.uniform(-JITTER, JITTER)
 
         self.x += dx
         self.y += dy
 
-        if self.x > CANVAS_WIDTH or self.y < 0 or self.y > CANVAS_HEIGHT:
+        inside_cylinder = math.hypot(self.x - CYLINDER_CENTER_X, self.y - CYLINDER_CENTER_Y) < CYLINDER_RADIUS
+        if self.x > CANVAS_WIDTH or self.y < 0 or self.y > CANVAS_HEIGHT or inside_cylinder:
             self.x = 0
             self.y = random.uniform(0, CANVAS_HEIGHT)
-            self.path.clear()
+            self.trail_start = None # Don't join the old streamline to the new one
             self.color_index = random.randint(0, len(STREAMLINE_COLORS) - 1)
 
-        speed = math.hypot(dx, dy)
-        gray = min(255, max(0, int(50 + speed * 40)))
+        self.speed = math.hypot(dx, dy)
+
+    def draw(self, canvas):
+        gray = min(255, max(0, int(50 + self.speed * 40)))
         color = f'rgb({gray},{gray},{gray})'
 
         if self.oval is None:
@@ -69,29 +286,266 @@ class Particle:
             canvas.moveto(self.oval, self.x - PARTICLE_RADIUS, self.y - PARTICLE_RADIUS)
             canvas.set_color(self.oval, color)
 
-        # Streamlines
-        self.path.append((self.x, self.y))
-        streamline_color = STREAMLINE_COLORS[self.color_index]
-        if len(self.path) > 2:
-            for i in range(1, len(self.path)):
-                x1, y1 = self.path[i - 1]
-                x2, y2 = self.path[i]
-                canvas.create_line(x1, y1, x2, y2, streamline_color)
+        # Streamlines: add the newest segment in place of the oldest one
+        if self.trail_start is not None:
+            oldest = self.trail[self.trail_next]
+            if oldest is not None:
+                canvas.delete(oldest)
+            x1, y1 = self.trail_start
+            self.trail[self.trail_next] = canvas.create_line(x1, y1, self.x, self.y, STREAMLINE_COLORS[self.color_index])
+            self.trail_next = (self.trail_next + 1) % TRAIL_LENGTH
+        self.trail_start = (self.x, self.y)
+
+
+class ParticleSystem:
+    """
+    Every particle at once, as parallel NumPy arrays of positions, speeds and
+    streamline colors. A frame is one vectorized step over all of them; only
+    the first `drawn` particles get a dot and a streamline on the canvas.
+    """
+
+    def __init__(self, count, drawn=DRAWN_PARTICLE_LIMIT, seed=None):
+        self.count = count
+        self.rng = np.random.default_rng(seed)
+        self.x = self.rng.uniform(0, CANVAS_WIDTH, count)
+        self.y = self.rng.uniform(0, CANVAS_HEIGHT, count)
+        self.speed = np.zeros(count)
+        self.color_index = self.rng.integers(0, len(STREAMLINE_COLORS), count)
+        self.respawned = np.zeros(count, dtype=bool)
+
+        # Canvas objects of the drawn particles
+        self.drawn = min(count, drawn)
+        self.ovals = []
+        self.grays = np.full(self.drawn, -1)
+        # All streamlines advance together, so they share one ring buffer index:
+        # trails[slot][particle] is a line ID, or None
+        self.trails = [[None] * self.drawn for _ in range(TRAIL_LENGTH)]
+        self.trail_next = 0
+        self.trail_start_x = self.x[:self.drawn].tolist()
+        self.trail_start_y = self.y[:self.drawn].tolist()
+
+    def step(self, flow_velocities=potential_flow_velocities):
+        """Moves every particle one frame and respawns those that left the flow at the inlet."""
+        dx, dy = flow_velocities(self.x, self.y)
+        dx = dx + self.rng.uniform(-JITTER, JITTER, self.count)
+        dy = dy + self.rng.uniform(-JITTER, JITTER, self.count)
+        self.x += dx
+        self.y += dy
+
+        respawned = ((self.x > CANVAS_WIDTH) | (self.y < 0) | (self.y > CANVAS_HEIGHT)
+                     | ((self.x - CYLINDER_CENTER_X) ** 2 + (self.y - CYLINDER_CENTER_Y) ** 2 < CYLINDER_RADIUS ** 2))
+        count = int(np.count_nonzero(respawned))
+        if count:
+            self.x[respawned] = 0
+            self.y[respawned] = self.rng.uniform(0, CANVAS_HEIGHT, count)
+            self.color_index[respawned] = self.rng.integers(0, len(STREAMLINE_COLORS), count)
+        self.respawned = respawned
+        self.speed = np.hypot(dx, dy)
+
+    def draw(self, canvas):
+        """Moves the drawn particles' dots and adds the newest segment of their streamlines."""
+        drawn = self.drawn
+        xs = self.x[:drawn].tolist()
+        ys = self.y[:drawn].tolist()
+        grays = np.clip(50 + self.speed[:drawn] * 40, 0, 255).astype(int)
+        recolor = (grays != self.grays).tolist()
+        self.grays = grays
+        grays = grays.tolist()
+
+        if not self.ovals:
+            for x, y, gray in zip(xs, ys, grays):
+                self.ovals.append(canvas.create_oval(x - PARTICLE_RADIUS, y - PARTICLE_RADIUS,
+                                                     x + PARTICLE_RADIUS, y + PARTICLE_RADIUS,
+                                                     f'rgb({gray},{gray},{gray})'))
+        else:
+            for oval, x, y, gray, changed in zip(self.ovals, xs, ys, grays, recolor):
+                canvas.moveto(oval, x - PARTICLE_RADIUS, y - PARTICLE_RADIUS)
+                if changed:
+                    canvas.set_color(oval, f'rgb({gray},{gray},{gray})')
+
+        # Streamlines: replace the oldest segment of each with the newest
+        slot = self.trails[self.trail_next]
+        segments = zip(self.trail_start_x, self.trail_start_y, xs, ys,
+                       self.color_index[:drawn].tolist(), self.respawned[:drawn].tolist())
+        for particle, (x1, y1, x2, y2, color_index, respawned) in enumerate(segments):
+            if slot[particle] is not None:
+                canvas.delete(slot[particle])
+            # No segment joins a respawned particle to where it was
+            slot[particle] = None if respawned else canvas.create_line(x1, y1, x2, y2, STREAMLINE_COLORS[color_index])
+        self.trail_next = (self.trail_next + 1) % TRAIL_LENGTH
+        self.trail_start_x, self.trail_start_y = xs, ys
+
+
+def run_particle_benchmark(counts=PARTICLE_BENCHMARK_COUNTS, frames=PARTICLE_BENCHMARK_FRAMES, flow_model="potential"):
+    """Prints the time to move the particles one frame with Particle objects and with a ParticleSystem."""
+    flow_velocity, flow_velocities = potential_flow_velocity, potential_flow_velocities
+    if flow_model == "lattice":
+        solver = LatticeBoltzmann(CANVAS_WIDTH // LATTICE_SCALE, CANVAS_HEIGHT // LATTICE_SCALE)
+        solver.step(500) # Let the wake develop
+        flow_velocity, flow_velocities = solver.velocity_at, solver.velocities_at
+
+    for count in counts:
+        particles = [Particle(random.uniform(0, CANVAS_WIDTH), random.uniform(0, CANVAS_HEIGHT))
+                     for _ in range(count)]
+        start = time.perf_counter()
+        for _ in range(frames):
+            for particle in particles:
+                particle.move(flow_velocity)
+        object_seconds = (time.perf_counter() - start) / frames
 
+        system = ParticleSystem(count, drawn=0, seed=1)
+        start = time.perf_counter()
+        for _ in range(frames):
+            system.step(flow_velocities)
+        array_seconds = (time.perf_counter() - start) / frames
 
-def main():
+        print(f"{count:>7} particles: objects {1000 * object_seconds:8.2f} ms/frame, "
+              f"arrays {1000 * array_seconds:7.2f} ms/frame ({object_seconds / array_seconds:.0f}x)")
+
+
+def best_time(function, *args, repeats=5):
+    """Shortest of several timed calls, in seconds, and the last result."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_field_benchmark(spacings=FIELD_BENCHMARK_SPACINGS, samples=FIELD_BENCHMARK_SAMPLES):
+    """
+    Prints how far the interpolated potential flow is from the formula, and
+    how long each takes, for a range of grid spacings.
+    """
+    rng = np.random.default_rng(1)
+    x = rng.uniform(0, CANVAS_WIDTH, samples)
+    y = rng.uniform(0, CANVAS_HEIGHT, samples)
+    # Only where particles can be: outside the cylinder
+    outside = (x - CYLINDER_CENTER_X) ** 2 + (y - CYLINDER_CENTER_Y) ** 2 >= CYLINDER_RADIUS ** 2
+    x, y = x[outside], y[outside]
+
+    scalar_seconds, _ = best_time(lambda: [potential_flow_velocity(px, py) for px, py in zip(x.tolist(), y.tolist())],
+                                  repeats=1)
+    formula_seconds, (exact_x, exact_y) = best_time(potential_flow_velocities, x, y)
+    print(f"{len(x)} positions. Formula per particle: {1000 * scalar_seconds:.1f} ms, "
+          f"vectorized formula: {1000 * formula_seconds:.2f} ms")
+
+    for spacing in spacings:
+        build_seconds, grid = best_time(VelocityGrid.from_function, potential_flow_velocities, spacing, repeats=1)
+        lookup_seconds, (dx, dy) = best_time(grid.velocities_at, x, y)
+        error = np.hypot(dx - exact_x, dy - exact_y) / FLOW_VELOCITY
+        print(f"Spacing {spacing:>2}px ({grid.cols} x {grid.rows} nodes, built in {1000 * build_seconds:.1f} ms): "
+              f"{1000 * lookup_seconds:.2f} ms; error relative to the inflow: median {np.median(error):.1e}, "
+              f"99th percentile {np.percentile(error, 99):.1e}, max {error.max():.1e}")
+
+
+def run_lattice_benchmark(grids=BENCHMARK_GRIDS, steps=BENCHMARK_STEPS):
+    """Prints the solver speed in MLUPS for a range of grid sizes."""
+    for nx, ny in grids:
+        # Keep the cylinder the same size relative to the grid
+        solver = LatticeBoltzmann(nx, ny, scale=CANVAS_WIDTH / nx)
+        solver.step(5) # Warm up
+        solver.steps, solver.seconds = 0, 0.0
+        solver.step(steps)
+        print(f"{nx:>4} x {ny:<4} {solver.mlups():7.2f} MLUPS ({1000 * solver.seconds / steps:.2f} ms/step)")
+
+
+def main(flow_model=FLOW_MODEL, particle_count=PARTICLE_COUNT, grid_spacing=FIELD_GRID_SPACING):
+    if Canvas is None:
+        print("Showing the flow needs the graphics module to open its window.")
+        return
     canvas = Canvas(CANVAS_WIDTH, CANVAS_HEIGHT)
 
     canvas.create_oval(CYLINDER_CENTER_X - CYLINDER_RADIUS, CYLINDER_CENTER_Y - CYLINDER_RADIUS,
                        CYLINDER_CENTER_X + CYLINDER_RADIUS, CYLINDER_CENTER_Y + CYLINDER_RADIUS,
                        'blue')
 
-    particles = [Particle(random.uniform(0, CANVAS_WIDTH), random.uniform(0, CANVAS_HEIGHT))
-                 for _ in range(PARTICLE_COUNT)]
+    particles = ParticleSystem(particle_count)
+
+    solver = None
+    flow_velocities = potential_flow_velocities
+    if flow_model == "potential" and grid_spacing:
+        # The analytic field never changes: sample it once and interpolate
+        flow_velocities = VelocityGrid.from_function(potential_flow_velocities, grid_spacing).velocities_at
+    if flow_model == "lattice":
+        solver = LatticeBoltzmann(CANVAS_WIDTH // LATTICE_SCALE, CANVAS_HEIGHT // LATTICE_SCALE)
+        flow_velocities = solver.velocities_at
 
+    frame = 0
     while True:
-        for particle in particles:
-            particle.update(canvas)
+        if solver is not None:
+            solver.step(LATTICE_STEPS_PER_FRAME)
+        particles.step(flow_velocities)
+        particles.draw(canvas)
+        frame += 1
+        if solver is not None and frame % MLUPS_REPORT_FRAMES == 0:
+            print(f"Lattice Boltzmann: {solver.nx} x {solver.ny} cells, {solver.mlups():.2f} MLUPS")
+
+def run_tools(argv):
+    """Entry point for the command line options."""
+    parser = argparse.ArgumentParser(prog="main.py", description="Flow past a cylinder.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Show the flow.")
+    run_parser.add_argument("--flow", choices=("lattice", "potential"), default=FLOW_MODEL,
+                            help=f"Velocity field to move the particles with (default {FLOW_MODEL}).")
+    run_parser.add_argument("--particles", type=int, default=PARTICLE_COUNT,
+                            help=f"Number of particles (default {PARTICLE_COUNT}; at most "
+                                 f"{DRAWN_PARTICLE_LIMIT} are drawn).")
+    run_parser.add_argument("--grid-spacing", type=float, default=FIELD_GRID_SPACING,
+                            help="Pixels between the samples of the potential flow; 0 evaluates the formula "
+                                 f"for every particle (default {FIELD_GRID_SPACING}).")
+
+    field_parser = commands.add_parser("field-bench",
+                                       help="Compare the interpolated potential flow with the formula.")
+    field_parser.add_argument("--spacings", default=None,
+                              help="Comma-separated grid spacings in pixels (default "
+                                   f"{','.join(map(str, FIELD_BENCHMARK_SPACINGS))}).")
+    field_parser.add_argument("--samples", type=int, default=FIELD_BENCHMARK_SAMPLES,
+                              help=f"Random positions to compare at (default {FIELD_BENCHMARK_SAMPLES}).")
+
+    particle_parser = commands.add_parser("particle-bench",
+                                          help="Compare Particle objects with the array particle engine.")
+    particle_parser.add_argument("--counts", default=None,
+                                 help="Comma-separated particle counts (default "
+                                      f"{','.join(map(str, PARTICLE_BENCHMARK_COUNTS))}).")
+    particle_parser.add_argument("--frames", type=int, default=PARTICLE_BENCHMARK_FRAMES,
+                                 help=f"Frames per count (default {PARTICLE_BENCHMARK_FRAMES}).")
+    particle_parser.add_argument("--flow", choices=("lattice", "potential"), default="potential",
+                                 help="Velocity field (default potential).")
+
+    bench_parser = commands.add_parser("lattice-bench", help="Time the lattice Boltzmann solver on several grid sizes.")
+    bench_parser.add_argument("--grids", default=None,
+                              help="Comma-separated NXxNY sizes (default "
+                                   f"{','.join(f'{nx}x{ny}' for nx, ny in BENCHMARK_GRIDS)}).")
+    bench_parser.add_argument("--steps", type=int, default=BENCHMARK_STEPS,
+                              help=f"Time steps per grid (default {BENCHMARK_STEPS}).")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        if Canvas is None:
+            print("Showing the flow needs the graphics module to open its window.")
+            return 1
+        main(args.flow, args.particles, args.grid_spacing)
+    elif args.command == "field-bench":
+        spacings = FIELD_BENCHMARK_SPACINGS
+        if args.spacings:
+            spacings = [float(spacing) for spacing in args.spacings.split(",")]
+        run_field_benchmark(spacings, args.samples)
+    elif args.command == "particle-bench":
+        counts = PARTICLE_BENCHMARK_COUNTS
+        if args.counts:
+            counts = [int(count) for count in args.counts.split(",")]
+        run_particle_benchmark(counts, args.frames, args.flow)
+    elif args.command == "lattice-bench":
+        grids = BENCHMARK_GRIDS
+        if args.grids:
+            grids = [tuple(int(size) for size in grid.split("x")) for grid in args.grids.split(",")]
+        run_lattice_benchmark(grids, args.steps)
+    return 0
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(run_tools(sys.argv[1:]))
     main()
@@ -1,13 +1,43 @@
-from graphics import Canvas
+try:
+    from graphics import Canvas
+except ImportError:
+    Canvas = None  # The headless tools (perft etc.) don't need a canvas
+import os
+import sys
+import re
+import json
+import struct
+import argparse
 import time
 import random
 import math
+import queue
+import threading
+import atexit
+import multiprocessing
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None  # Not in every Python build (e.g. in the browser); only the parallel search needs it
+try:
+    import mmap
+except ImportError:
+    mmap = None  # Opening books are then read into memory instead
+from array import array
 #from playsound import playsound # Import the playsound library
 
 # === API Configuration ===
 # Add your API key here for AI integration
 API_KEY = ""    # Put your API key here when you get one
 
+# === AI Configuration ===
+AI_TIME_BUDGET = 1.0  # Seconds of wall-clock time the AI may spend searching each move
+AI_MAX_DEPTH = 64  # Iterative deepening stops here even if time remains
+TT_SIZE_MB = 16  # Memory cap for the transposition table
+AI_WORKERS = 1  # Search processes for the AI's moves; more than 1 enables the parallel (Lazy SMP) search
+TABLEBASE_DIR = "tablebases"  # Built with "python main.py tablebase-build"; searched without tables if missing
+OPENING_BOOK_FILE = "book.bin"  # Built with "python main.py book-build games.pgn"; the AI plays without one if missing
+
 # Define the dimensions of the canvas
 CANVAS_WIDTH = 500
 CANVAS_HEIGHT = 500
@@ -18,6 +48,11 @@ NUM_SQUARES_PER_SIDE = 8
 # Calculate the size of each square
 SQUARE_SIZE = CANVAS_WIDTH / NUM_SQUARES_PER_SIDE
 
+# Move highlights are created once and parked off the canvas when not in use
+HIGHLIGHT_POOL_SIZE = 27  # The most squares one piece can reach (a queen in the centre)
+HIDDEN_X = -2 * CANVAS_WIDTH
+HIDDEN_Y = -2 * CANVAS_HEIGHT
+
 # Define a list of color schemes for the chessboard
 COLOR_SCHEMES = [
     ["ghostwhite", "lightgray"],     # Classic black and white
@@ -58,23 +93,742 @@ PIECE_IMAGES = {
     'p': 'wp.png'   # White Pawn
 }
 
+# Keys that take back the last move during a game
+UNDO_KEYS = ['u', 'U', 'Backspace']
+
 # Sound file constants (these will no longer be used for playback)
 CAPTURE_SOUND_FILE = "capture.mp3"
 MOVE_SOUND_FILE = "move-sound.mp3"
 
+# --- Bitboard position representation ---
+#
+# Squares are numbered row * 8 + col, so square 0 is the top-left corner
+# (a8, black's rook) and square 63 is the bottom-right corner (h1).
+# Bit N of a bitboard is set when square N is occupied.
+
+WHITE = 0
+BLACK = 1
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+# Piece index = color * 6 + piece type. The character at that index is the
+# piece as it appears on the string board (white lowercase, black uppercase).
+BOARD_PIECES = 'pnbrqkPNBRQK'
+EMPTY = -1
+
+ROOK_DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+# Castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+# Rows where pawns start and promote, per color
+PAWN_START_ROW = [6, 1]
+PROMOTION_ROW = [0, 7]
+
+def square_index(row, col):
+    """Convert a (row, col) pair into a 0-63 square number."""
+    return row * NUM_SQUARES_PER_SIDE + col
+
+def square_row_col(square):
+    """Convert a 0-63 square number back into a (row, col) pair."""
+    return divmod(square, NUM_SQUARES_PER_SIDE)
+
+def iterate_bits(bitboard):
+    """Yield the square number of every set bit, lowest first."""
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+def lowest_square(bitboard):
+    return (bitboard & -bitboard).bit_length() - 1
+
+def build_step_attacks(offsets):
+    """Precompute the attack bitboard of a single-step piece from every square."""
+    table = []
+    for square in range(64):
+        row, col = square_row_col(square)
+        attacks = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                attacks |= 1 << square_index(r, c)
+        table.append(attacks)
+    return table
+
+KNIGHT_ATTACKS = build_step_attacks([(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)])
+KING_ATTACKS = build_step_attacks(ROOK_DIRECTIONS + BISHOP_DIRECTIONS)
+# White pawns move up the board (towards row 0), black pawns move down.
+PAWN_ATTACKS = [build_step_attacks([(-1, -1), (-1, 1)]), build_step_attacks([(1, -1), (1, 1)])]
+
+def build_rays(dr, dc):
+    """Precompute, for every square, the empty-board ray in one direction."""
+    table = []
+    for square in range(64):
+        row, col = square_row_col(square)
+        ray = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            ray |= 1 << square_index(r, c)
+            r += dr
+            c += dc
+        table.append(ray)
+    return table
+
+# Rays are split by whether they run towards higher or lower square numbers:
+# the nearest blocker on a positive ray is its lowest set bit, on a negative
+# ray its highest set bit.
+POSITIVE_ROOK_RAYS = [build_rays(0, 1), build_rays(1, 0)]
+NEGATIVE_ROOK_RAYS = [build_rays(0, -1), build_rays(-1, 0)]
+POSITIVE_BISHOP_RAYS = [build_rays(1, 1), build_rays(1, -1)]
+NEGATIVE_BISHOP_RAYS = [build_rays(-1, 1), build_rays(-1, -1)]
+
+ROOK_RAYS = [sum(rays[square] for rays in POSITIVE_ROOK_RAYS + NEGATIVE_ROOK_RAYS) for square in range(64)]
+BISHOP_RAYS = [sum(rays[square] for rays in POSITIVE_BISHOP_RAYS + NEGATIVE_BISHOP_RAYS) for square in range(64)]
+
+def build_between():
+    """BETWEEN[a][b] holds the squares strictly between two aligned squares (0 otherwise)."""
+    table = [[0] * 64 for _ in range(64)]
+    for square in range(64):
+        row, col = square_row_col(square)
+        for dr, dc in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            passed = 0
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                target = square_index(r, c)
+                table[square][target] = passed
+                passed |= 1 << target
+                r += dr
+                c += dc
+    return table
+
+BETWEEN = build_between()
+
+def rook_attacks(square, occupied):
+    """Rook attacks from a square, stopping at the first blocker on each ray."""
+    attacks = 0
+    for rays in POSITIVE_ROOK_RAYS:
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in NEGATIVE_ROOK_RAYS:
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+def bishop_attacks(square, occupied):
+    """Bishop attacks from a square, stopping at the first blocker on each ray."""
+    attacks = 0
+    for rays in POSITIVE_BISHOP_RAYS:
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in NEGATIVE_BISHOP_RAYS:
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+# Castling rights that survive a move touching each square: moving the king
+# or a rook off its home square (or capturing that rook) clears the right.
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[square_index(7, 4)] = 15 ^ (WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[square_index(7, 7)] = 15 ^ WHITE_KINGSIDE
+CASTLING_MASK[square_index(7, 0)] = 15 ^ WHITE_QUEENSIDE
+CASTLING_MASK[square_index(0, 4)] = 15 ^ (BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[square_index(0, 7)] = 15 ^ BLACK_KINGSIDE
+CASTLING_MASK[square_index(0, 0)] = 15 ^ BLACK_QUEENSIDE
+
+# For each castling right: (right, king from, king to, rook from, rook to,
+# squares that must be empty, squares the king crosses that must not be attacked)
+CASTLING_MOVES = [
+    [(WHITE_KINGSIDE, 60, 62, 63, 61, (1 << 61) | (1 << 62), (1 << 61) | (1 << 62)),
+     (WHITE_QUEENSIDE, 60, 58, 56, 59, (1 << 57) | (1 << 58) | (1 << 59), (1 << 58) | (1 << 59))],
+    [(BLACK_KINGSIDE, 4, 6, 7, 5, (1 << 5) | (1 << 6), (1 << 5) | (1 << 6)),
+     (BLACK_QUEENSIDE, 4, 2, 0, 3, (1 << 1) | (1 << 2) | (1 << 3), (1 << 2) | (1 << 3))],
+]
+CASTLING_ROOK_MOVES = {king_to: (rook_from, rook_to)
+                       for moves in CASTLING_MOVES for _, _, king_to, rook_from, rook_to, _, _ in moves}
+
+# Zobrist keys: one random 64-bit number per (piece, square), per castling
+# rights combination and per en passant file, plus one for the side to move.
+# A position's hash is the XOR of the keys of everything in it, so moving a
+# piece only needs two XORs. The generator is seeded so hashes are identical
+# on every run.
+_zobrist_random = random.Random(20250601)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+
+# Piece-square tables, written as seen from white's side of the board (row 0
+# is black's back rank), so white looks up square and black square ^ 56.
+# Each entry is a bonus in centipawns for a piece standing on that square.
+PAWN_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+     5,  5, 10, 25, 25, 10,  5,  5,
+     0,  0,  0, 20, 20,  0,  0,  0,
+     5, -5,-10,  0,  0,-10, -5,  5,
+     5, 10, 10,-20,-20, 10, 10,  5,
+     0,  0,  0,  0,  0,  0,  0,  0,
+]
+PAWN_ENDGAME_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+    80, 80, 80, 80, 80, 80, 80, 80,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    20, 20, 20, 20, 20, 20, 20, 20,
+    10, 10, 10, 10, 10, 10, 10, 10,
+    10, 10, 10, 10, 10, 10, 10, 10,
+     0,  0,  0,  0,  0,  0,  0,  0,
+]
+KNIGHT_TABLE = [
+   -50,-40,-30,-30,-30,-30,-40,-50,
+   -40,-20,  0,  0,  0,  0,-20,-40,
+   -30,  0, 10, 15, 15, 10,  0,-30,
+   -30,  5, 15, 20, 20, 15,  5,-30,
+   -30,  0, 15, 20, 20, 15,  0,-30,
+   -30,  5, 10, 15, 15, 10,  5,-30,
+   -40,-20,  0,  5,  5,  0,-20,-40,
+   -50,-40,-30,-30,-30,-30,-40,-50,
+]
+BISHOP_TABLE = [
+   -20,-10,-10,-10,-10,-10,-10,-20,
+   -10,  0,  0,  0,  0,  0,  0,-10,
+   -10,  0,  5, 10, 10,  5,  0,-10,
+   -10,  5,  5, 10, 10,  5,  5,-10,
+   -10,  0, 10, 10, 10, 10,  0,-10,
+   -10, 10, 10, 10, 10, 10, 10,-10,
+   -10,  5,  0,  0,  0,  0,  5,-10,
+   -20,-10,-10,-10,-10,-10,-10,-20,
+]
+ROOK_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+     5, 10, 10, 10, 10, 10, 10,  5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+     0,  0,  0,  5,  5,  0,  0,  0,
+]
+QUEEN_TABLE = [
+   -20,-10,-10, -5, -5,-10,-10,-20,
+   -10,  0,  0,  0,  0,  0,  0,-10,
+   -10,  0,  5,  5,  5,  5,  0,-10,
+    -5,  0,  5,  5,  5,  5,  0, -5,
+     0,  0,  5,  5,  5,  5,  0, -5,
+   -10,  5,  5,  5,  5,  5,  0,-10,
+   -10,  0,  5,  0,  0,  0,  0,-10,
+   -20,-10,-10, -5, -5,-10,-10,-20,
+]
+KING_TABLE = [
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -20,-30,-30,-40,-40,-30,-30,-20,
+   -10,-20,-20,-20,-20,-20,-20,-10,
+    20, 20,  0,  0,  0,  0, 20, 20,
+    20, 30, 10,  0,  0, 10, 30, 20,
+]
+KING_ENDGAME_TABLE = [
+   -50,-40,-30,-20,-20,-30,-40,-50,
+   -30,-20,-10,  0,  0,-10,-20,-30,
+   -30,-10, 20, 30, 30, 20,-10,-30,
+   -30,-10, 30, 40, 40, 30,-10,-30,
+   -30,-10, 30, 40, 40, 30,-10,-30,
+   -30,-10, 20, 30, 30, 20,-10,-30,
+   -30,-30,  0,  0,  0,  0,-30,-30,
+   -50,-30,-30,-30,-30,-30,-30,-50,
+]
+
+# Material in the middlegame and the endgame: pawns and rooks gain value as
+# the board empties, minor pieces lose a little.
+MIDDLEGAME_VALUES = [100, 320, 330, 500, 900, 0]
+ENDGAME_VALUES = [120, 300, 310, 530, 940, 0]
+MIDDLEGAME_TABLES = [PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE]
+ENDGAME_TABLES = [PAWN_ENDGAME_TABLE, KNIGHT_TABLE, BISHOP_TABLE, [0] * 64, QUEEN_TABLE, KING_ENDGAME_TABLE]
+
+# Game phase: 24 with all minor and major pieces on the board, 0 with none
+PHASE_WEIGHTS = [0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+def build_score_table(values, tables):
+    """Material plus square bonus per (piece index, square), positive for white and negative for black."""
+    table = []
+    for piece in range(12):
+        color, piece_type = divmod(piece, 6)
+        if color == WHITE:
+            table.append([values[piece_type] + tables[piece_type][square] for square in range(64)])
+        else:
+            table.append([-(values[piece_type] + tables[piece_type][square ^ 56]) for square in range(64)])
+    return table
+
+MIDDLEGAME_SCORES = build_score_table(MIDDLEGAME_VALUES, MIDDLEGAME_TABLES)
+ENDGAME_SCORES = build_score_table(ENDGAME_VALUES, ENDGAME_TABLES)
+
+def encode_move(from_square, to_square, promotion=0):
+    """
+    Pack a move into a single integer: bits 0-5 origin, bits 6-11 destination,
+    bits 12-14 the piece type a pawn promotes to (0 for other moves).
+    """
+    return from_square | (to_square << 6) | (promotion << 12)
+
+def move_from(move):
+    return move & 63
+
+def move_to(move):
+    return (move >> 6) & 63
+
+def move_promotion(move):
+    return move >> 12
+
+FILES = 'abcdefgh'
+PROMOTION_LETTERS = {KNIGHT: 'n', BISHOP: 'b', ROOK: 'r', QUEEN: 'q'}
+
+def square_name(square):
+    """Algebraic name of a square, e.g. 60 -> 'e1'."""
+    row, col = square_row_col(square)
+    return FILES[col] + str(8 - row)
+
+def square_from_name(name):
+    return square_index(8 - int(name[1]), FILES.index(name[0]))
+
+def move_to_uci(move):
+    """Long algebraic notation, e.g. 'e2e4' or 'e7e8q'."""
+    text = square_name(move_from(move)) + square_name(move_to(move))
+    if move_promotion(move):
+        text += PROMOTION_LETTERS[move_promotion(move)]
+    return text
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+class Position:
+    """
+    A chess position stored as bitboards: one 64-bit integer per piece type and
+    color, plus per-color and total occupancy masks. A square-indexed list of
+    piece indices is kept alongside so "what is on this square" is a lookup.
+    """
+    def __init__(self):
+        self.pieces = [0] * 12  # One bitboard per piece index
+        self.occupancy = [0, 0]  # All white pieces, all black pieces
+        self.occupied = 0  # Every piece on the board
+        self.squares = [EMPTY] * 64  # Piece index on each square
+        self.side = WHITE  # Side to move
+        self.hash = ZOBRIST_CASTLING[0]  # Zobrist key, kept up to date by put_piece/remove_piece/make_move
+        self.king_squares = [EMPTY, EMPTY]
+        self.castling = 0  # Castling rights bits
+        self.ep_square = EMPTY  # Square a pawn can capture en passant onto
+        self.history = []  # Undo stack: (move, captured, hash, castling, ep_square, halfmove_clock) per move played
+        self.hash_counts = {}  # How often each hash on the undo stack occurs, for repetition checks
+        self.halfmove_clock = 0  # Plies since the last capture or pawn move
+        self.fullmove_number = 1  # FEN move counter, incremented after each black move
+        # Evaluation terms (white minus black), kept up to date by put_piece/remove_piece
+        self.middlegame_score = 0
+        self.endgame_score = 0
+        self.phase = 0
+
+    @classmethod
+    def from_board(cls, board, side=WHITE):
+        """
+        Build a position from an 8x8 grid of piece characters. Castling rights
+        are granted wherever a king and rook still stand on their home squares.
+        """
+        position = cls()
+        for r in range(NUM_SQUARES_PER_SIDE):
+            for c in range(NUM_SQUARES_PER_SIDE):
+                if board[r][c]:
+                    position.put_piece(BOARD_PIECES.index(board[r][c]), square_index(r, c))
+        castling = 0
+        for moves in CASTLING_MOVES:
+            for right, king_from, _, rook_from, _, _, _ in moves:
+                color = WHITE if right in (WHITE_KINGSIDE, WHITE_QUEENSIDE) else BLACK
+                if (position.squares[king_from] == color * 6 + KING
+                        and position.squares[rook_from] == color * 6 + ROOK):
+                    castling |= right
+        position.set_state(side, castling, EMPTY)
+        return position
+
+    def set_state(self, side, castling, ep_square):
+        """Set the side to move, castling rights and en passant square, updating the hash."""
+        if self.side == BLACK:
+            self.hash ^= ZOBRIST_SIDE
+        self.hash ^= ZOBRIST_CASTLING[self.castling]
+        if self.ep_square != EMPTY:
+            self.hash ^= ZOBRIST_EN_PASSANT[self.ep_square % 8]
+        self.side = side
+        self.castling = castling
+        self.ep_square = ep_square
+        if side == BLACK:
+            self.hash ^= ZOBRIST_SIDE
+        self.hash ^= ZOBRIST_CASTLING[castling]
+        if ep_square != EMPTY:
+            self.hash ^= ZOBRIST_EN_PASSANT[ep_square % 8]
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+        Build a position from a FEN string. Note FEN writes white pieces in
+        uppercase, the opposite of the board grid, so piece letters are swapped.
+        """
+        fields = fen.split()
+        board = []
+        for rank in fields[0].split('/'):
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row.extend([''] * int(char))
+                else:
+                    row.append(char.swapcase())
+            board.append(row)
+        position = cls.from_board(board)
+        side = WHITE if fields[1] == 'w' else BLACK
+        castling = 0
+        for char, right in zip('KQkq', (WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+            if char in fields[2]:
+                castling |= right
+        ep_square = EMPTY
+        if fields[3] != '-':
+            # Like make_move, only keep an en passant square that can be used
+            ep_square = square_from_name(fields[3])
+            if not PAWN_ATTACKS[side ^ 1][ep_square] & position.pieces[side * 6 + PAWN]:
+                ep_square = EMPTY
+        position.set_state(side, castling, ep_square)
+        if len(fields) > 4 and fields[4].isdigit():
+            position.halfmove_clock = int(fields[4])
+        if len(fields) > 5 and fields[5].isdigit():
+            position.fullmove_number = max(int(fields[5]), 1)
+        return position
+
+    def to_fen(self):
+        """Return the position as a FEN string."""
+        ranks = []
+        for r in range(NUM_SQUARES_PER_SIDE):
+            rank, empty = '', 0
+            for piece in self.squares[r * 8:r * 8 + 8]:
+                if piece == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += BOARD_PIECES[piece].swapcase()
+            ranks.append(rank + (str(empty) if empty else ''))
+        castling = ''.join(char for char, right in zip('KQkq', (WHITE_KINGSIDE, WHITE_QUEENSIDE,
+                                                               BLACK_KINGSIDE, BLACK_QUEENSIDE))
+                           if self.castling & right) or '-'
+        ep = square_name(self.ep_square) if self.ep_square != EMPTY else '-'
+        return f"{'/'.join(ranks)} {'w' if self.side == WHITE else 'b'} {castling} {ep} {self.halfmove_clock} {self.fullmove_number}"
+
+    def to_board(self):
+        """Return the position as an 8x8 grid of piece characters."""
+        return [[BOARD_PIECES[piece] if piece != EMPTY else '' for piece in self.squares[r * 8:r * 8 + 8]]
+                for r in range(NUM_SQUARES_PER_SIDE)]
+
+    def copy(self):
+        """Return an independent copy of this position."""
+        position = Position.__new__(Position)
+        position.pieces = self.pieces[:]
+        position.occupancy = self.occupancy[:]
+        position.occupied = self.occupied
+        position.squares = self.squares[:]
+        position.side = self.side
+        position.hash = self.hash
+        position.king_squares = self.king_squares[:]
+        position.castling = self.castling
+        position.ep_square = self.ep_square
+        position.history = self.history[:]
+        position.hash_counts = self.hash_counts.copy()
+        position.halfmove_clock = self.halfmove_clock
+        position.fullmove_number = self.fullmove_number
+        position.middlegame_score = self.middlegame_score
+        position.endgame_score = self.endgame_score
+        position.phase = self.phase
+        return position
+
+    def put_piece(self, piece, square):
+        bit = 1 << square
+        self.pieces[piece] |= bit
+        self.occupancy[piece // 6] |= bit
+        self.occupied |= bit
+        self.squares[square] = piece
+        self.hash ^= ZOBRIST_PIECES[piece][square]
+        self.middlegame_score += MIDDLEGAME_SCORES[piece][square]
+        self.endgame_score += ENDGAME_SCORES[piece][square]
+        self.phase += PHASE_WEIGHTS[piece % 6]
+        if piece % 6 == KING:
+            self.king_squares[piece // 6] = square
+
+    def remove_piece(self, piece, square):
+        bit = 1 << square
+        self.pieces[piece] ^= bit
+        self.occupancy[piece // 6] ^= bit
+        self.occupied ^= bit
+        self.squares[square] = EMPTY
+        self.hash ^= ZOBRIST_PIECES[piece][square]
+        self.middlegame_score -= MIDDLEGAME_SCORES[piece][square]
+        self.endgame_score -= ENDGAME_SCORES[piece][square]
+        self.phase -= PHASE_WEIGHTS[piece % 6]
+
+    def attacks_from(self, piece, square):
+        """Attack bitboard of the given piece standing on the given square."""
+        piece_type = piece % 6
+        if piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[square]
+        if piece_type == KING:
+            return KING_ATTACKS[square]
+        if piece_type == PAWN:
+            return PAWN_ATTACKS[piece // 6][square]
+        if piece_type == ROOK:
+            return rook_attacks(square, self.occupied)
+        if piece_type == BISHOP:
+            return bishop_attacks(square, self.occupied)
+        return rook_attacks(square, self.occupied) | bishop_attacks(square, self.occupied)
+
+    def attackers_to(self, square, color, occupied):
+        """Bitboard of the given color's pieces attacking a square, with custom occupancy."""
+        pieces = self.pieces
+        base = color * 6
+        queens = pieces[base + QUEEN]
+        return ((KNIGHT_ATTACKS[square] & pieces[base + KNIGHT])
+                | (PAWN_ATTACKS[color ^ 1][square] & pieces[base + PAWN])
+                | (KING_ATTACKS[square] & pieces[base + KING])
+                | (rook_attacks(square, occupied) & (pieces[base + ROOK] | queens))
+                | (bishop_attacks(square, occupied) & (pieces[base + BISHOP] | queens)))
+
+    def repetitions(self):
+        """How many times the current position occurred earlier in the game."""
+        return self.hash_counts.get(self.hash, 0)
+
+    def is_rule_draw(self):
+        """True on a threefold repetition or once fifty moves pass without a capture or pawn move."""
+        return self.halfmove_clock >= 100 or self.repetitions() >= 2
+
+    def in_check(self):
+        """True when the side to move's king is attacked."""
+        return self.attackers_to(self.king_squares[self.side], self.side ^ 1, self.occupied) != 0
+
+    def generate_moves(self, captures_only=False):
+        """
+        Generate every legal move for the side to move (or only the captures).
+
+        Checks and pins are found once up front from the king's rays, so each
+        candidate move is filtered with bitboard masks instead of being played
+        and tested. Only king moves and en passant need an attack lookup.
+        """
+        moves = []
+        side = self.side
+        enemy_side = side ^ 1
+        pieces = self.pieces
+        occupied = self.occupied
+        own = self.occupancy[side]
+        enemy = self.occupancy[enemy_side]
+        king_square = self.king_squares[side]
+        enemy_base = enemy_side * 6
+        enemy_queens = pieces[enemy_base + QUEEN]
+        enemy_rooks = pieces[enemy_base + ROOK] | enemy_queens
+        enemy_bishops = pieces[enemy_base + BISHOP] | enemy_queens
+
+        # King moves: the king itself is lifted off the board so it can't
+        # hide behind its own square from a slider
+        targets = KING_ATTACKS[king_square] & ~own
+        if captures_only:
+            targets &= enemy
+        without_king = occupied ^ (1 << king_square)
+        for to_square in iterate_bits(targets):
+            if not self.attackers_to(to_square, enemy_side, without_king):
+                moves.append(encode_move(king_square, to_square))
+
+        checkers = self.attackers_to(king_square, enemy_side, occupied)
+        if checkers & (checkers - 1):
+            return moves  # Double check: only the king can move
+
+        # Squares a non-king move must land on: anywhere, or block/capture the checker
+        if checkers:
+            target_mask = checkers | BETWEEN[king_square][lowest_square(checkers)]
+        else:
+            target_mask = (1 << 64) - 1
+        if captures_only:
+            target_mask &= enemy
+
+        # Pinned pieces may only move along the line between king and pinner
+        pinned = 0
+        pin_masks = {}
+        for pinner in iterate_bits((ROOK_RAYS[king_square] & enemy_rooks) | (BISHOP_RAYS[king_square] & enemy_bishops)):
+            between = BETWEEN[king_square][pinner]
+            blockers = between & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned |= blockers
+                pin_masks[lowest_square(blockers)] = between | (1 << pinner)
+
+        # Pawns
+        pawn = side * 6 + PAWN
+        promotion_row = PROMOTION_ROW[side]
+        forward = -8 if side == WHITE else 8
+        for from_square in iterate_bits(pieces[pawn]):
+            allowed = target_mask & pin_masks[from_square] if pinned >> from_square & 1 else target_mask
+            destinations = PAWN_ATTACKS[side][from_square] & enemy
+            to_square = from_square + forward
+            if not occupied >> to_square & 1:
+                destinations |= 1 << to_square
+                if from_square // 8 == PAWN_START_ROW[side] and not occupied >> (to_square + forward) & 1:
+                    destinations |= 1 << (to_square + forward)
+            for to_square in iterate_bits(destinations & allowed):
+                if to_square // 8 == promotion_row:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        moves.append(encode_move(from_square, to_square, promotion))
+                else:
+                    moves.append(encode_move(from_square, to_square))
+
+            # En passant can uncover a check along the row both pawns leave,
+            # so it is verified by lifting both pawns off the board
+            ep_square = self.ep_square
+            if ep_square != EMPTY and PAWN_ATTACKS[side][from_square] >> ep_square & 1:
+                captured_square = ep_square - forward
+                after = (occupied ^ (1 << from_square) ^ (1 << captured_square)) | (1 << ep_square)
+                if not ((rook_attacks(king_square, after) & enemy_rooks)
+                        | (bishop_attacks(king_square, after) & enemy_bishops)
+                        | (KNIGHT_ATTACKS[king_square] & pieces[enemy_base + KNIGHT])
+                        | (PAWN_ATTACKS[side][king_square] & pieces[enemy_base + PAWN] & ~(1 << captured_square))):
+                    moves.append(encode_move(from_square, ep_square))
+
+        # Knights, bishops, rooks and queens
+        for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN):
+            piece = side * 6 + piece_type
+            for from_square in iterate_bits(pieces[piece]):
+                allowed = target_mask & pin_masks[from_square] if pinned >> from_square & 1 else target_mask
+                for to_square in iterate_bits(self.attacks_from(piece, from_square) & ~own & allowed):
+                    moves.append(encode_move(from_square, to_square))
+
+        # Castling: the king may not start in, pass through or land in check
+        if self.castling and not checkers and not captures_only:
+            for right, king_from, king_to, _, _, empty_squares, safe_squares in CASTLING_MOVES[side]:
+                if self.castling & right and not occupied & empty_squares:
+                    if not any(self.attackers_to(square, enemy_side, occupied) for square in iterate_bits(safe_squares)):
+                        moves.append(encode_move(king_from, king_to))
+        return moves
+
+    def make_move(self, move):
+        """Play a legal move and pass the turn to the other side."""
+        from_square = move_from(move)
+        to_square = move_to(move)
+        promotion = move >> 12
+        side = self.side
+        piece = self.squares[from_square]
+        captured = self.squares[to_square]
+        self.history.append((move, captured, self.hash, self.castling, self.ep_square, self.halfmove_clock))
+        self.hash_counts[self.hash] = self.hash_counts.get(self.hash, 0) + 1
+        if captured != EMPTY or piece % 6 == PAWN:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if side == BLACK:
+            self.fullmove_number += 1
+
+        if captured != EMPTY:
+            self.remove_piece(captured, to_square)
+        self.remove_piece(piece, from_square)
+        self.put_piece(side * 6 + promotion if promotion else piece, to_square)
+
+        ep_square = EMPTY
+        piece_type = piece % 6
+        if piece_type == PAWN:
+            if to_square == self.ep_square:
+                # En passant: the captured pawn sits behind the destination square
+                captured_square = to_square + (8 if side == WHITE else -8)
+                self.remove_piece(self.squares[captured_square], captured_square)
+            elif abs(to_square - from_square) == 16:
+                # Only record an en passant square when a capture is actually possible
+                middle = (from_square + to_square) // 2
+                if PAWN_ATTACKS[side][middle] & self.pieces[(side ^ 1) * 6 + PAWN]:
+                    ep_square = middle
+        elif piece_type == KING and abs(to_square - from_square) == 2:
+            rook_from, rook_to = CASTLING_ROOK_MOVES[to_square]
+            self.remove_piece(side * 6 + ROOK, rook_from)
+            self.put_piece(side * 6 + ROOK, rook_to)
+
+        self.set_state(side ^ 1, self.castling & CASTLING_MASK[from_square] & CASTLING_MASK[to_square], ep_square)
+
+    def unmake_move(self):
+        """Take back the last move played and return it."""
+        move, captured, previous_hash, castling, ep_square, self.halfmove_clock = self.history.pop()
+        count = self.hash_counts[previous_hash] - 1
+        if count:
+            self.hash_counts[previous_hash] = count
+        else:
+            del self.hash_counts[previous_hash]
+        from_square = move_from(move)
+        to_square = move_to(move)
+        side = self.side ^ 1
+        if side == BLACK:
+            self.fullmove_number -= 1
+        piece = self.squares[to_square]
+        self.remove_piece(piece, to_square)
+        if move >> 12:
+            piece = side * 6 + PAWN
+        self.put_piece(piece, from_square)
+
+        if captured != EMPTY:
+            self.put_piece(captured, to_square)
+        elif piece % 6 == PAWN and to_square == ep_square:
+            self.put_piece((side ^ 1) * 6 + PAWN, to_square + (8 if side == WHITE else -8))
+        elif piece % 6 == KING and abs(to_square - from_square) == 2:
+            rook_from, rook_to = CASTLING_ROOK_MOVES[to_square]
+            self.remove_piece(side * 6 + ROOK, rook_to)
+            self.put_piece(side * 6 + ROOK, rook_from)
+
+        self.side = side
+        self.castling = castling
+        self.ep_square = ep_square
+        self.hash = previous_hash
+        return move
+
 # Game state variables
 class GameState:
     def __init__(self):
-        self.board = self.get_initial_board()
+        self.position = Position.from_board(self.get_initial_board())
         self.selected_piece = None  # (row, col) of selected piece
-        self.selected_square_id = None  # Canvas object ID for highlighting
-        self.possible_moves = []  # List of (row, col) tuples
-        self.move_highlights = []  # List of canvas object IDs for move highlights
-        self.current_player = 'white'  # 'white' or 'black'
+        self.selected_square_id = None  # Pooled canvas rectangle marking the selected piece
+        self.possible_moves = set()  # (row, col) targets of the selected piece
+        self.move_highlights = []  # Pooled canvas rectangles for move targets, hidden when unused
+        self.highlights_shown = 0  # How many of move_highlights are on the board
+        self.legal_moves = {}  # (row, col) -> set of (row, col) targets for the side to move
         self.piece_objects = {}  # Dictionary to store piece canvas objects
+        self.drawn_board = [[''] * NUM_SQUARES_PER_SIDE for _ in range(NUM_SQUARES_PER_SIDE)]  # What the sprites show
+        self.game_over_text_id = None
         self.is_game_over = False
         self.winner = None
-        
+        self.transposition_table = TranspositionTable()  # Kept across AI moves
+        self.parallel_searcher = None  # Created on first use when AI_WORKERS > 1
+        self.opening_book = load_opening_book()  # None when there is no book file
+        self.tablebases = load_tablebases()  # None when there is no tablebase directory
+        update_legal_moves(self)
+
+    @property
+    def board(self):
+        """The 8x8 string grid, derived from the bitboards (used for drawing)."""
+        return self.position.to_board()
+
+    @property
+    def current_player(self):
+        return 'white' if self.position.side == WHITE else 'black'
+
     def get_initial_board(self):
         """Returns the standard initial chess board setup."""
         return [
@@ -164,47 +918,70 @@ def draw_chessboard_squares(canvas, light_color, dark_color):
                 left_x, top_y, right_x, bottom_y, color
             )
 
+def create_piece_sprite(canvas, piece, r, c):
+    """Draws one piece on the given square and returns its canvas ID."""
+    image_file = PIECE_IMAGES.get(piece, None)
+    
+    # Calculate position (top-left corner of the square with small padding)
+    left_x = c * SQUARE_SIZE + 5
+    top_y = r * SQUARE_SIZE + 5
+    
+    # Calculate size (square size minus padding)
+    piece_size = SQUARE_SIZE - 10
+    
+    try:
+        # Draw the piece image
+        return canvas.create_image_with_size(
+            left_x, top_y, 
+            piece_size, piece_size, 
+            image_file
+        )
+    except:
+        # Fallback to text if image loading fails
+        fallback_chars = {
+            'R': '♜', 'N': '♞', 'B': '♝', 'Q': '♛', 'K': '♚', 'P': '♟',
+            'r': '♖', 'n': '♘', 'b': '♗', 'q': '♕', 'k': '♔', 'p': '♙'
+        }
+        char = fallback_chars.get(piece, '?')
+        piece_color = "black" if piece.isupper() else "white"
+        center_x = c * SQUARE_SIZE + SQUARE_SIZE / 2
+        center_y = r * SQUARE_SIZE + SQUARE_SIZE / 2
+        return draw_centered_text(canvas, center_x, center_y - 10, char, int(SQUARE_SIZE * 0.7), piece_color)
+
 def draw_pieces(canvas, game_state):
-    """Draws all pieces on the board based on the current board state."""
-    # Clear existing piece objects
-    for piece_id in game_state.piece_objects.values():
-        canvas.delete(piece_id)
-    game_state.piece_objects.clear()
+    """
+    Brings the piece sprites in line with the board. Only squares whose piece
+    changed are touched: a sprite whose piece left its square is moved to the
+    square that gained that piece, and anything left over is deleted or created.
+    A normal move therefore moves one sprite and a capture also deletes one.
+    """
+    board = game_state.board
+    drawn = game_state.drawn_board
+    vacated = []  # (piece, (row, col), sprite ID) no longer matching the board
+    appeared = []  # (row, col) squares that need a sprite
     
     for r in range(NUM_SQUARES_PER_SIDE):
         for c in range(NUM_SQUARES_PER_SIDE):
-            piece = game_state.board[r][c]
-            if piece != '':
-                image_file = PIECE_IMAGES.get(piece, None)
-                
-                if image_file:
-                    # Calculate position (top-left corner of the square with small padding)
-                    left_x = c * SQUARE_SIZE + 5
-                    top_y = r * SQUARE_SIZE + 5
-                    
-                    # Calculate size (square size minus padding)
-                    piece_size = SQUARE_SIZE - 10
-                    
-                    try:
-                        # Draw the piece image and store its ID
-                        piece_id = canvas.create_image_with_size(
-                            left_x, top_y, 
-                            piece_size, piece_size, 
-                            image_file
-                        )
-                        game_state.piece_objects[(r, c)] = piece_id
-                    except:
-                        # Fallback to text if image loading fails
-                        fallback_chars = {
-                            'R': '♜', 'N': '♞', 'B': '♝', 'Q': '♛', 'K': '♚', 'P': '♟',
-                            'r': '♖', 'n': '♘', 'b': '♗', 'q': '♕', 'k': '♔', 'p': '♙'
-                        }
-                        char = fallback_chars.get(piece, '?')
-                        piece_color = "black" if piece.isupper() else "white"
-                        center_x = c * SQUARE_SIZE + SQUARE_SIZE / 2
-                        center_y = r * SQUARE_SIZE + SQUARE_SIZE / 2
-                        piece_id = draw_centered_text(canvas, center_x, center_y - 10, char, int(SQUARE_SIZE * 0.7), piece_color)
-                        game_state.piece_objects[(r, c)] = piece_id
+            if board[r][c] != drawn[r][c]:
+                if drawn[r][c]:
+                    vacated.append((drawn[r][c], (r, c), game_state.piece_objects.pop((r, c))))
+                if board[r][c]:
+                    appeared.append((r, c))
+                drawn[r][c] = board[r][c]
+    
+    for r, c in appeared:
+        piece = board[r][c]
+        for i, (old_piece, (old_r, old_c), piece_id) in enumerate(vacated):
+            if old_piece == piece:
+                canvas.move(piece_id, (c - old_c) * SQUARE_SIZE, (r - old_r) * SQUARE_SIZE)
+                del vacated[i]
+                break
+        else:
+            piece_id = create_piece_sprite(canvas, piece, r, c)
+        game_state.piece_objects[(r, c)] = piece_id
+    
+    for _, _, piece_id in vacated:
+        canvas.delete(piece_id)
 
 def get_square_from_click(click_x, click_y):
     """Convert click coordinates to board square (row, col)."""
@@ -227,171 +1004,70 @@ def highlight_square(canvas, row, col, color="yellow", alpha=0.5):
         color, color
     )
 
+def create_highlight_pool(canvas, game_state):
+    """
+    Creates every highlight rectangle the game will need, hidden off the
+    board. Call it after drawing the squares and before the pieces, so the
+    highlights always sit between the two and never cover a piece.
+    """
+    game_state.selected_square_id = highlight_square(canvas, 0, 0, "yellow")
+    game_state.move_highlights = [highlight_square(canvas, 0, 0, "lightgreen") for _ in range(HIGHLIGHT_POOL_SIZE)]
+    game_state.highlights_shown = len(game_state.move_highlights)
+    clear_highlights(canvas, game_state)
+
+def move_highlight(canvas, highlight_id, row, col):
+    """Moves a pooled highlight rectangle onto a square."""
+    canvas.moveto(highlight_id, col * SQUARE_SIZE + 2, row * SQUARE_SIZE + 2)
+
 def clear_highlights(canvas, game_state):
-    """Clear all move highlights from the board."""
-    if game_state.selected_square_id:
-        canvas.delete(game_state.selected_square_id)
-        game_state.selected_square_id = None
-    
-    for highlight_id in game_state.move_highlights:
-        canvas.delete(highlight_id)
-    game_state.move_highlights.clear()
+    """Hide all move highlights (they stay on the canvas for reuse)."""
+    if game_state.selected_square_id is not None:
+        canvas.moveto(game_state.selected_square_id, HIDDEN_X, HIDDEN_Y)
+    for highlight_id in game_state.move_highlights[:game_state.highlights_shown]:
+        canvas.moveto(highlight_id, HIDDEN_X, HIDDEN_Y)
+    game_state.highlights_shown = 0
 
-def is_valid_position(row, col):
-    """Check if position is within board boundaries."""
-    return 0 <= row < NUM_SQUARES_PER_SIDE and 0 <= col < NUM_SQUARES_PER_SIDE
+def clear_selection(canvas, game_state):
+    """Deselect the selected piece, if any, and hide its highlights."""
+    clear_highlights(canvas, game_state)
+    game_state.selected_piece = None
+    game_state.possible_moves = set()
 
-def is_enemy_piece(piece1, piece2):
-    """Check if two pieces are enemies (different colors)."""
-    if not piece1 or not piece2:
-        return False
-    return piece1.isupper() != piece2.isupper()
+def select_piece(canvas, game_state, row, col):
+    """Select the piece on a square and highlight it and its moves."""
+    game_state.selected_piece = (row, col)
+    game_state.possible_moves = get_possible_moves(game_state, row, col)
+    move_highlight(canvas, game_state.selected_square_id, row, col)
+    for highlight_id, (move_row, move_col) in zip(game_state.move_highlights, game_state.possible_moves):
+        move_highlight(canvas, highlight_id, move_row, move_col)
+    game_state.highlights_shown = len(game_state.possible_moves)
 
-def is_friendly_piece(piece1, piece2):
-    """Check if two pieces are friendly (same color)."""
-    if not piece1 or not piece2:
-        return False
-    return piece1.isupper() == piece2.isupper()
+def update_legal_moves(game_state):
+    """Work out every legal move for the side to move, once per turn."""
+    legal_moves = {}
+    for move in game_state.position.generate_moves():
+        # The four promotion choices share one destination square
+        legal_moves.setdefault(square_row_col(move_from(move)), set()).add(square_row_col(move_to(move)))
+    game_state.legal_moves = legal_moves
 
 def get_possible_moves(game_state, row, col):
     """Get all possible moves for a piece at the given position."""
-    piece = game_state.board[row][col]
-    if not piece:
-        return []
-    
-    moves = []
-    piece_type = piece.lower()
-    
-    if piece_type == 'p':  # Pawn
-        moves = get_pawn_moves(game_state, row, col, piece)
-    elif piece_type == 'r':  # Rook
-        moves = get_rook_moves(game_state, row, col)
-    elif piece_type == 'n':  # Knight
-        moves = get_knight_moves(game_state, row, col)
-    elif piece_type == 'b':  # Bishop
-        moves = get_bishop_moves(game_state, row, col)
-    elif piece_type == 'q':  # Queen
-        moves = get_queen_moves(game_state, row, col)
-    elif piece_type == 'k':  # King
-        moves = get_king_moves(game_state, row, col)
-    
-    return moves
-
-def get_pawn_moves(game_state, row, col, piece):
-    """Get possible moves for a pawn."""
-    moves = []
-    direction = -1 if piece.islower() else 1  # White pawns move up (-1), black pawns move down (+1)
-    start_row = 6 if piece.islower() else 1
-    
-    # Move forward one square
-    new_row = row + direction
-    if is_valid_position(new_row, col) and not game_state.board[new_row][col]:
-        moves.append((new_row, col))
-        
-        # Move forward two squares from starting position
-        if row == start_row:
-            new_row = row + 2 * direction
-            if is_valid_position(new_row, col) and not game_state.board[new_row][col]:
-                moves.append((new_row, col))
-    
-    # Capture diagonally
-    for dc in [-1, 1]:
-        new_row, new_col = row + direction, col + dc
-        if is_valid_position(new_row, new_col):
-            target = game_state.board[new_row][new_col]
-            if target and is_enemy_piece(piece, target):
-                moves.append((new_row, new_col))
-    
-    return moves
-
-def get_rook_moves(game_state, row, col):
-    """Get possible moves for a rook."""
-    moves = []
-    directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]  # Right, Left, Down, Up
-    
-    for dr, dc in directions:
-        for i in range(1, NUM_SQUARES_PER_SIDE):
-            new_row, new_col = row + i * dr, col + i * dc
-            if not is_valid_position(new_row, new_col):
-                break
-            
-            target = game_state.board[new_row][new_col]
-            if not target:
-                moves.append((new_row, new_col))
-            elif is_enemy_piece(game_state.board[row][col], target):
-                moves.append((new_row, new_col))
-                break
-            else:
-                break
-    
-    return moves
-
-def get_knight_moves(game_state, row, col):
-    """Get possible moves for a knight."""
-    moves = []
-    knight_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
-    
-    for dr, dc in knight_moves:
-        new_row, new_col = row + dr, col + dc
-        if is_valid_position(new_row, new_col):
-            target = game_state.board[new_row][new_col]
-            if not target or is_enemy_piece(game_state.board[row][col], target):
-                moves.append((new_row, new_col))
-    
-    return moves
-
-def get_bishop_moves(game_state, row, col):
-    """Get possible moves for a bishop."""
-    moves = []
-    directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]  # Diagonals
-    
-    for dr, dc in directions:
-        for i in range(1, NUM_SQUARES_PER_SIDE):
-            new_row, new_col = row + i * dr, col + i * dc
-            if not is_valid_position(new_row, new_col):
-                break
-            
-            target = game_state.board[new_row][new_col]
-            if not target:
-                moves.append((new_row, new_col))
-            elif is_enemy_piece(game_state.board[row][col], target):
-                moves.append((new_row, new_col))
-                break
-            else:
-                break
-    
-    return moves
-
-def get_queen_moves(game_state, row, col):
-    """Get possible moves for a queen (combination of rook and bishop)."""
-    return get_rook_moves(game_state, row, col) + get_bishop_moves(game_state, row, col)
-
-def get_king_moves(game_state, row, col):
-    """Get possible moves for a king."""
-    moves = []
-    directions = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
-    
-    for dr, dc in directions:
-        new_row, new_col = row + dr, col + dc
-        if is_valid_position(new_row, new_col):
-            target = game_state.board[new_row][new_col]
-            if not target or is_enemy_piece(game_state.board[row][col], target):
-                moves.append((new_row, new_col))
-    
-    return moves
+    return game_state.legal_moves.get((row, col), set())
 
-def make_move(game_state, from_pos, to_pos):
-    """Make a move on the board."""
-    from_row, from_col = from_pos
-    to_row, to_col = to_pos
+def make_move(game_state, from_pos, to_pos, promotion=QUEEN):
+    """Make a move on the board. Pawns reaching the last row promote (to a queen by default)."""
+    from_square = square_index(*from_pos)
+    to_square = square_index(*to_pos)
+    position = game_state.position
     
     # Check if it's a capture before moving the piece
-    is_capture = game_state.board[to_row][to_col] != ''
+    is_capture = position.squares[to_square] != EMPTY or to_square == position.ep_square
 
-    # Move the piece
-    piece = game_state.board[from_row][from_col]
-    game_state.board[from_row][from_col] = ''
-    game_state.board[to_row][to_col] = piece
+    # Move the piece and switch players
+    if position.squares[from_square] % 6 != PAWN or to_pos[0] != PROMOTION_ROW[position.side]:
+        promotion = 0
+    position.make_move(encode_move(from_square, to_square, promotion))
+    update_legal_moves(game_state)
 
     # Sound playback removed as per user request
     # try:
@@ -402,31 +1078,32 @@ def make_move(game_state, from_pos, to_pos):
     # except Exception as e:
     #     print(f"Error playing sound: {e}")
     
-    # Switch players
-    game_state.current_player = 'black' if game_state.current_player == 'white' else 'white'
-    
     # Check for game over conditions (simplified)
     check_game_over(game_state)
 
 def check_game_over(game_state):
-    """Simple game over check (can be expanded)."""
-    # Count kings
-    white_king = False
-    black_king = False
-    
-    for row in game_state.board:
-        for piece in row:
-            if piece == 'k':
-                white_king = True
-            elif piece == 'K':
-                black_king = True
-    
-    if not white_king:
-        game_state.is_game_over = True
-        game_state.winner = 'Black'
-    elif not black_king:
-        game_state.is_game_over = True
-        game_state.winner = 'White'
+    """End the game on checkmate, stalemate, threefold repetition or the fifty-move rule."""
+    position = game_state.position
+    if game_state.legal_moves:
+        if position.is_rule_draw():
+            game_state.is_game_over = True
+            game_state.winner = None
+        return
+    game_state.is_game_over = True
+    if position.in_check():
+        game_state.winner = 'Black' if position.side == WHITE else 'White'
+    else:
+        game_state.winner = None  # Stalemate
+
+def undo_move(game_state):
+    """Take back the last move played. Returns False when there is nothing to undo."""
+    if not game_state.position.history:
+        return False
+    game_state.position.unmake_move()
+    update_legal_moves(game_state)
+    game_state.is_game_over = False
+    game_state.winner = None
+    return True
 
 def handle_square_click(canvas, game_state, row, col):
     """Handle clicking on a board square."""
@@ -436,15 +1113,7 @@ def handle_square_click(canvas, game_state, row, col):
     if game_state.selected_piece is None:
         if piece and ((piece.islower() and game_state.current_player == 'white') or 
                       (piece.isupper() and game_state.current_player == 'black')):
-            # Select this piece
-            game_state.selected_piece = (row, col)
-            game_state.selected_square_id = highlight_square(canvas, row, col, "yellow")
-            
-            # Get and highlight possible moves
-            game_state.possible_moves = get_possible_moves(game_state, row, col)
-            for move_row, move_col in game_state.possible_moves:
-                highlight_id = highlight_square(canvas, move_row, move_col, "lightgreen")
-                game_state.move_highlights.append(highlight_id)
+            select_piece(canvas, game_state, row, col)
     
     else:
         # A piece is already selected
@@ -454,57 +1123,1575 @@ def handle_square_click(canvas, game_state, row, col):
             # Clicking on the same piece - deselect
             clear_highlights(canvas, game_state)
             game_state.selected_piece = None
-            game_state.possible_moves = []
+            game_state.possible_moves = set()
         
-        elif (row, col) in game_state.possible_moves:
-            # Valid move
+        elif (row, col) in get_possible_moves(game_state, selected_row, selected_col):
+            # Valid move (checked against this turn's moves, not the ones cached at selection)
             make_move(game_state, game_state.selected_piece, (row, col))
             clear_highlights(canvas, game_state)
             game_state.selected_piece = None
-            game_state.possible_moves = []
+            game_state.possible_moves = set()
             draw_pieces(canvas, game_state)
         
         else:
             # Invalid move or selecting another piece
             clear_highlights(canvas, game_state)
             game_state.selected_piece = None
-            game_state.possible_moves = []
+            game_state.possible_moves = set()
             
             # If clicking on own piece, select it
             if piece and ((piece.islower() and game_state.current_player == 'white') or 
                           (piece.isupper() and game_state.current_player == 'black')):
-                game_state.selected_piece = (row, col)
-                game_state.selected_square_id = highlight_square(canvas, row, col, "yellow")
-                
-                game_state.possible_moves = get_possible_moves(game_state, row, col)
-                for move_row, move_col in game_state.possible_moves:
-                    highlight_id = highlight_square(canvas, move_row, move_col, "lightgreen")
-                    game_state.move_highlights.append(highlight_id)
-
-def make_ai_move(game_state):
-    """Make a simple AI move (random for now - can be enhanced with API_KEY)."""
+                select_piece(canvas, game_state, row, col)
+
+# --- AI search ---
+
+PIECE_VALUES = [100, 320, 330, 500, 900, 0]  # Pawn, knight, bishop, rook, queen, king
+MATE_SCORE = 100000
+INFINITY = 1000000
+TIME_CHECK_INTERVAL = 1024  # Nodes between wall-clock checks
+KILLER_SLOTS = 2  # Quiet moves remembered per ply for causing a cutoff
+
+# Transposition table entry bounds
+TT_EXACT = 1
+TT_LOWER = 2  # Score is at least this (the search failed high)
+TT_UPPER = 3  # Score is at most this (the search failed low)
+TT_SLOT_BYTES = 16  # One 64-bit key plus one 64-bit packed entry
+TT_SCORE_OFFSET = 1 << 23  # Keeps packed scores non-negative
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results keyed by Zobrist hash.
+
+    Each bucket has two slots: the first keeps the deepest result seen for
+    that bucket (depth-preferred), the second is overwritten by every store
+    that doesn't qualify for the first (always-replace). Entries live in two
+    flat runs of 64-bit integers inside one buffer, so the memory use is
+    exactly size_mb. Passing a shared memory buffer lets several processes
+    use the same table.
+
+    A packed entry holds the move in bits 0-15, the depth in bits 16-23, the
+    bound in bits 24-25 and the offset score from bit 26 up. The key slot
+    stores key XOR entry, so an entry half-written by another process reads
+    back as a miss instead of as another position's data.
+    """
+    def __init__(self, size_mb=TT_SIZE_MB, buffer=None):
+        self.bucket_count = max(1, size_mb * 1024 * 1024 // (2 * TT_SLOT_BYTES))
+        slot_count = 2 * self.bucket_count
+        self.storage = buffer if buffer is not None else bytearray(self.size_in_bytes(size_mb))
+        words = memoryview(self.storage).cast('B').cast('Q')
+        self.keys = words[:slot_count]
+        self.entries = words[slot_count:2 * slot_count]
+        self.probes = 0
+        self.hits = 0
+
+    @staticmethod
+    def size_in_bytes(size_mb):
+        return max(1, size_mb * 1024 * 1024 // (2 * TT_SLOT_BYTES)) * 2 * TT_SLOT_BYTES
+
+    def clear(self):
+        self.keys[:] = array('Q', bytes(8 * len(self.keys)))
+        self.entries[:] = array('Q', bytes(8 * len(self.entries)))
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """Return (move, depth, bound, score) for the key, or None on a miss."""
+        self.probes += 1
+        slot = (key % self.bucket_count) * 2
+        entry = self.entries[slot]
+        if self.keys[slot] ^ entry != key:
+            slot += 1
+            entry = self.entries[slot]
+            if self.keys[slot] ^ entry != key:
+                return None
+        self.hits += 1
+        return entry & 0xFFFF, (entry >> 16) & 0xFF, (entry >> 24) & 3, (entry >> 26) - TT_SCORE_OFFSET
+
+    def store(self, key, move, depth, bound, score):
+        slot = (key % self.bucket_count) * 2
+        entry = (move & 0xFFFF) | (depth << 16) | (bound << 24) | ((score + TT_SCORE_OFFSET) << 26)
+        stored = self.entries[slot]
+        if self.keys[slot] ^ stored == key or depth >= (stored >> 16) & 0xFF:
+            self.keys[slot] = key ^ entry
+            self.entries[slot] = entry
+        else:
+            self.keys[slot + 1] = key ^ entry
+            self.entries[slot + 1] = entry
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+def score_to_tt(score, ply):
+    """Mate scores are stored relative to the node, not the root."""
+    if score >= MATE_SCORE - 1000:
+        return score + ply
+    if score <= -MATE_SCORE + 1000:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score >= MATE_SCORE - 1000:
+        return score - ply
+    if score <= -MATE_SCORE + 1000:
+        return score + ply
+    return score
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out."""
+
+def evaluate(position):
+    """
+    Material plus piece-square bonuses from the point of view of the side to
+    move, blended from the middlegame and endgame terms by how much material
+    is left. The terms are maintained incrementally by the position, so this
+    is constant time.
+    """
+    phase = min(position.phase, MAX_PHASE)
+    score = (position.middlegame_score * phase + position.endgame_score * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if position.side == WHITE else -score
+
+def capture_order(squares, move):
+    """Sort key for captures and promotions: most valuable victim first, least valuable attacker breaking ties."""
+    victim = squares[move >> 6 & 63]
+    value = PIECE_VALUES[victim % 6] if victim != EMPTY else 0
+    if move >> 12:
+        value += PIECE_VALUES[move >> 12]
+    return value * 8 - squares[move & 63] % 6
+
+class Searcher:
+    """
+    Negamax alpha-beta search with iterative deepening and a capture-only
+    quiescence search, bounded by a wall-clock time budget. Results are kept
+    in a transposition table that can be shared between searches.
+    """
+    def __init__(self, time_budget=AI_TIME_BUDGET, max_depth=AI_MAX_DEPTH, transposition_table=None, book=None,
+                 tablebases=None):
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.tt = transposition_table if transposition_table is not None else TranspositionTable()
+        self.book = book  # An OpeningBook consulted before searching, or None
+        self.tablebases = tablebases  # Endgame Tablebases probed inside the tree, or None
+        self.nodes = 0
+        self.deadline = 0
+        self.helper_id = 0  # Parallel search helpers with odd IDs start one ply deeper
+        self.killers = [[0] * KILLER_SLOTS for _ in range(max_depth + 1)]
+        self.history = [[0] * 4096, [0] * 4096]  # Per side, indexed by from | to << 6
+        # Cutoff statistics for the last search
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.iteration_nodes = []  # Nodes spent on each completed depth
+
+    def search(self, position):
+        """
+        Search the position and return (best_move, score, depth, nodes, seconds).
+        best_move is None when the side to move has no moves at all. A book
+        move is returned without searching, with depth and nodes 0.
+        """
+        start = time.time()
+        if self.book is not None:
+            move = self.book.choose(position)
+            if move is not None:
+                return move, 0, 0, 0, time.time() - start
+        self.deadline = start + self.time_budget
+        self.nodes = 0
+        self.tt.probes = self.tt.hits = 0
+        self.cutoffs = self.first_move_cutoffs = 0
+        self.iteration_nodes = []
+        for killers in self.killers:
+            killers[:] = [0] * KILLER_SLOTS
+        for history in self.history:
+            for index, value in enumerate(history):
+                if value:
+                    history[index] = value >> 1  # Age the previous search's history
+        best_move, best_score, completed_depth = None, 0, 0
+        root_height = len(position.history)
+
+        for depth in range(1 + self.helper_id % 2, self.max_depth + 1):
+            try:
+                move, score = self.search_root(position, depth, best_move)
+            except SearchTimeout:
+                # Take back the moves the interrupted search left on the board
+                while len(position.history) > root_height:
+                    position.unmake_move()
+                break
+            if move is None:
+                break
+            best_move, best_score, completed_depth = move, score, depth
+            self.iteration_nodes.append(self.nodes - sum(self.iteration_nodes))
+            if abs(score) >= MATE_SCORE - self.max_depth:
+                break  # A forced mate was found, deeper search won't change it
+
+        if best_move is None:
+            # Not even depth 1 finished in time - fall back to any move
+            moves = position.generate_moves()
+            best_move = moves[0] if moves else None
+        return best_move, best_score, completed_depth, self.nodes, time.time() - start
+
+    def search_root(self, position, depth, previous_best):
+        moves = position.generate_moves()
+        if previous_best in moves:
+            # Search the best move of the previous iteration first
+            moves.remove(previous_best)
+            moves.insert(0, previous_best)
+
+        best_move, alpha = None, -INFINITY
+        for move in moves:
+            position.make_move(move)
+            score = -self.negamax(position, depth - 1, -INFINITY, -alpha, 1)
+            position.unmake_move()
+            if score > alpha:
+                best_move, alpha = move, score
+        if best_move is not None:
+            self.tt.store(position.hash, best_move, depth, TT_EXACT, score_to_tt(alpha, 0))
+        return best_move, alpha
+
+    def first_move_cutoff_rate(self):
+        """Fraction of beta cutoffs that came from the first move searched."""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def branching_factor(self):
+        """Effective branching factor: nodes of the last completed depth over those of the one before."""
+        if len(self.iteration_nodes) < 2 or self.iteration_nodes[-2] == 0:
+            return 0.0
+        return self.iteration_nodes[-1] / self.iteration_nodes[-2]
+
+    def ordered_moves(self, position, moves, hash_move, ply):
+        """
+        Yield moves in stages: the hash move, then captures and promotions by
+        MVV-LVA, then this ply's killer moves, then the remaining quiet moves
+        by history score. Later stages are only sorted if the earlier ones
+        didn't already produce a cutoff.
+        """
+        if hash_move and hash_move in moves:
+            yield hash_move
+        squares = position.squares
+        captures, quiets = [], []
+        for move in moves:
+            if move == hash_move:
+                continue
+            if squares[move >> 6 & 63] != EMPTY or move >> 12:
+                captures.append(move)
+            else:
+                quiets.append(move)
+        captures.sort(key=lambda move: capture_order(squares, move), reverse=True)
+        yield from captures
+
+        for killer in self.killers[ply]:
+            if killer in quiets:
+                quiets.remove(killer)
+                yield killer
+        history = self.history[position.side]
+        quiets.sort(key=lambda move: history[move & 4095], reverse=True)
+        yield from quiets
+
+    def record_cutoff(self, position, move, depth, ply, move_number):
+        """Update the statistics and, for a quiet move, the killer and history tables."""
+        self.cutoffs += 1
+        if move_number == 0:
+            self.first_move_cutoffs += 1
+        if position.squares[move >> 6 & 63] != EMPTY or move >> 12:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1:] = killers[:-1]
+            killers[0] = move
+        self.history[position.side][move & 4095] += depth * depth
+
+    def count_node(self):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0 and self.out_of_time():
+            raise SearchTimeout()
+
+    def out_of_time(self):
+        return time.time() > self.deadline
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        self.count_node()
+        if position.halfmove_clock >= 100 or position.hash in position.hash_counts:
+            return 0  # Any repetition is scored as a draw: if it's good for one side it can repeat again
+        if self.tablebases is not None and position.occupied.bit_count() <= TABLEBASE_PIECES:
+            value = self.tablebases.probe(position)
+            if value is not None:
+                return tablebase_score(value, ply)
+        if depth <= 0:
+            return self.quiescence(position, alpha, beta, ply)
+
+        hash_move = 0
+        entry = self.tt.probe(position.hash)
+        if entry is not None:
+            hash_move, entry_depth, bound, score = entry
+            if entry_depth >= depth:
+                score = score_from_tt(score, ply)
+                if (bound == TT_EXACT or (bound == TT_LOWER and score >= beta)
+                        or (bound == TT_UPPER and score <= alpha)):
+                    return score
+
+        moves = position.generate_moves()
+        if not moves:
+            return -MATE_SCORE + ply if position.in_check() else 0  # Checkmate or stalemate
+
+        original_alpha = alpha
+        best_move, best_score = 0, -INFINITY
+        for move_number, move in enumerate(self.ordered_moves(position, moves, hash_move, ply)):
+            position.make_move(move)
+            score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score > best_score:
+                best_move, best_score = move, score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        self.record_cutoff(position, move, depth, ply, move_number)
+                        break
+
+        if best_score >= beta:
+            bound = TT_LOWER
+        elif best_score > original_alpha:
+            bound = TT_EXACT
+        else:
+            bound = TT_UPPER
+        self.tt.store(position.hash, best_move, depth, bound, score_to_tt(best_score, ply))
+        return best_score
+
+    def quiescence(self, position, alpha, beta, ply, evade_checks=True):
+        """
+        Search captures only, so the static evaluation is never taken mid-exchange.
+        A check is answered with every evasion only where quiescence starts;
+        deeper in, evasions would turn each checking capture into a full-width
+        search and the capture tree explodes.
+        """
+        self.count_node()
+        if evade_checks and position.in_check():
+            moves = position.generate_moves()
+            if not moves:
+                return -MATE_SCORE + ply
+        else:
+            stand_pat = evaluate(position)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = position.generate_moves(captures_only=True)
+            squares = position.squares
+            moves.sort(key=lambda move: capture_order(squares, move), reverse=True)
+
+        for move in moves:
+            position.make_move(move)
+            score = -self.quiescence(position, -beta, -alpha, ply + 1, False)
+            position.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+def report_search(depth, score, nodes, seconds, hit_rate):
+    """Print the throughput line for one AI move."""
+    if depth == 0 and nodes == 0:
+        print("AI: book move")
+        return
+    nodes_per_second = int(nodes / seconds) if seconds > 0 else nodes
+    print(f"AI: depth {depth}, score {score}, {nodes} nodes in {seconds:.2f}s ({nodes_per_second} nodes/sec), "
+          f"TT hit rate {hit_rate:.1%}")
+
+def play_engine_move(game_state, move):
+    """Play a move in the engine's packed format through the normal make_move path."""
+    make_move(game_state, square_row_col(move_from(move)), square_row_col(move_to(move)),
+              move_promotion(move))
+
+def make_ai_move(game_state, time_budget=AI_TIME_BUDGET):
+    """Search for the best move within the time budget and play it."""
     if API_KEY:
         # TODO: Implement API-based AI move here
         # This is where you would make an API call to get the best move
         print("AI API integration ready - implement your preferred chess API here")
     
-    # Simple random AI for demonstration
-    all_pieces = []
-    for r in range(NUM_SQUARES_PER_SIDE):
-        for c in range(NUM_SQUARES_PER_SIDE):
-            piece = game_state.board[r][c]
-            if piece and ((piece.isupper() and game_state.current_player == 'black') or
-                          (piece.islower() and game_state.current_player == 'white')):
-                moves = get_possible_moves(game_state, r, c)
-                for move in moves:
-                    all_pieces.append(((r, c), move))
+    if AI_WORKERS > 1 and shared_memory is not None:
+        if game_state.parallel_searcher is None:
+            game_state.parallel_searcher = ParallelSearcher(AI_WORKERS, time_budget, book=game_state.opening_book,
+                                                            tablebase_dir=TABLEBASE_DIR)
+        searcher = game_state.parallel_searcher
+        move, score, depth, nodes, seconds = searcher.search(game_state.position)
+        hit_rate = searcher.hit_rate
+    else:
+        searcher = Searcher(time_budget, transposition_table=game_state.transposition_table,
+                            book=game_state.opening_book, tablebases=game_state.tablebases)
+        move, score, depth, nodes, seconds = searcher.search(game_state.position)
+        hit_rate = searcher.tt.hit_rate()
+        if depth:
+            print(f"AI: {searcher.cutoffs} cutoffs, {searcher.first_move_cutoff_rate():.1%} on the first move, "
+                  f"branching factor {searcher.branching_factor():.2f}")
     
-    if all_pieces:
-        from_pos, to_pos = random.choice(all_pieces)
-        make_move(game_state, from_pos, to_pos)
+    if move is not None:
+        report_search(depth, score, nodes, seconds, hit_rate)
+        play_engine_move(game_state, move)
         return True
     return False
 
+# --- Background engine (pondering) ---
+
+class PonderSearcher(Searcher):
+    """A Searcher whose deadline is owned by a BackgroundEngine, so the UI thread can move it."""
+    def __init__(self, engine, transposition_table, book=None, tablebases=None):
+        super().__init__(transposition_table=transposition_table, book=book, tablebases=tablebases)
+        self.engine = engine
+
+    def out_of_time(self):
+        return time.time() > self.engine.deadline
+
+class BackgroundEngine:
+    """
+    Runs the AI search on a worker thread so the UI loop never blocks.
+
+    While the human thinks, the engine guesses their reply and searches the
+    position after it (pondering). If the guess is right the running search
+    just gets a normal deadline, so its move is ready at once or shortly
+    after; otherwise it is stopped and the real position is searched.
+    Finished searches come back through a thread-safe queue drained by poll().
+    """
+    def __init__(self, transposition_table, time_budget=AI_TIME_BUDGET, book=None, tablebases=None,
+                 workers=AI_WORKERS):
+        self.time_budget = time_budget
+        self.searcher = PonderSearcher(self, transposition_table, book, tablebases)
+        self.workers = workers if shared_memory is not None else 1
+        self.parallel_searcher = None  # Created on the first AI move when workers > 1
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()  # Guards request_id, deadline and the running search's details
+        self.request_id = 0
+        self.deadline = 0.0
+        self.search_hash = None  # Hash of the position being searched right now
+        self.search_started = 0.0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def ponder(self, position):
+        """Start thinking on the human's time about the given position (human to move)."""
+        self.submit(position.copy(), True)
+
+    def think(self, position):
+        """Find a move for the given position (AI to move), reusing a matching ponder search."""
+        with self.lock:
+            if self.search_hash == position.hash:
+                # Ponder hit: the search already running is for this position
+                self.deadline = self.search_started + self.time_budget
+                return
+        self.submit(position.copy(), False)
+
+    def stop(self):
+        """Abandon whatever the engine is doing; its result will be discarded."""
+        with self.lock:
+            self.request_id += 1
+            self.deadline = 0.0
+            self.search_hash = None
+
+    def poll(self, position_hash):
+        """
+        Drain the result queue. Returns (move, score, depth, nodes, seconds, hit_rate)
+        for a finished search of the given position, or None if there isn't one yet.
+        """
+        found = None
+        while True:
+            try:
+                request_id, result_hash, result = self.results.get_nowait()
+            except queue.Empty:
+                return found
+            if request_id == self.request_id and result_hash == position_hash:
+                found = result
+
+    def submit(self, position, pondering):
+        with self.lock:
+            self.request_id += 1
+            self.deadline = 0.0  # Stop the search that is running now, if any
+            self.search_hash = None
+            self.requests.put((self.request_id, position, pondering))
+
+    def run(self):
+        """Worker thread: serve search requests one at a time, skipping outdated ones."""
+        while True:
+            request_id, position, pondering = self.requests.get()
+            if pondering:
+                with self.lock:
+                    if request_id != self.request_id:
+                        continue
+                    self.deadline = time.time() + self.time_budget / 2
+                guess = self.predict_reply(position)
+                if guess is None:
+                    continue
+                position.make_move(guess)
+
+            with self.lock:
+                if request_id != self.request_id:
+                    continue
+                self.search_hash = position.hash
+                self.search_started = time.time()
+                # A ponder search runs until a ponder hit gives it a real deadline
+                self.deadline = float('inf') if pondering else self.search_started + self.time_budget
+            if pondering or self.workers <= 1:
+                move, score, depth, nodes, seconds = self.searcher.search(position)
+                hit_rate = self.searcher.tt.hit_rate()
+            else:
+                # The AI's own turn: spread the search over worker processes. It keeps
+                # its own time budget, so a stop() only discards its result.
+                if self.parallel_searcher is None:
+                    self.parallel_searcher = ParallelSearcher(self.workers, self.time_budget, book=self.searcher.book,
+                                                              tablebase_dir=TABLEBASE_DIR)
+                move, score, depth, nodes, seconds = self.parallel_searcher.search(position)
+                hit_rate = self.parallel_searcher.hit_rate
+            self.results.put((request_id, position.hash, (move, score, depth, nodes, seconds, hit_rate)))
+
+    def predict_reply(self, position):
+        """The move the human is expected to play: the hash move, or a quick search's choice."""
+        entry = self.searcher.tt.probe(position.hash)
+        if entry is not None and entry[0] in position.generate_moves():
+            return entry[0]
+        return self.searcher.search(position)[0]
+
+# --- Parallel search (Lazy SMP) ---
+#
+# Every worker process runs the same iterative-deepening search on the same
+# root position. They share nothing but the transposition table, which lives
+# in shared memory, so each worker's results cut off subtrees for the others.
+# Odd-numbered helpers search one ply deeper to spread the work out.
+
+_smp_table = None  # Per-worker view of the shared transposition table
+_smp_memory = None
+_smp_stop = None  # Set by the parent once the main worker has finished
+_smp_tablebases = None
+
+class SmpSearcher(Searcher):
+    """A Searcher that also stops when the parent process says the search is over."""
+    def out_of_time(self):
+        return time.time() > self.deadline or _smp_stop.is_set()
+
+def _smp_worker_init(memory_name, size_mb, stop_event, tablebase_dir):
+    global _smp_table, _smp_memory, _smp_stop, _smp_tablebases
+    _smp_memory = shared_memory.SharedMemory(name=memory_name)
+    _smp_table = TranspositionTable(size_mb, buffer=_smp_memory.buf)
+    _smp_stop = stop_event
+    _smp_tablebases = load_tablebases(tablebase_dir) if tablebase_dir else None
+
+def _smp_search(position, helper_id, time_budget, max_depth):
+    searcher = SmpSearcher(time_budget, max_depth, transposition_table=_smp_table, tablebases=_smp_tablebases)
+    searcher.helper_id = helper_id
+    move, score, depth, nodes, seconds = searcher.search(position)
+    return move, score, depth, nodes, seconds, searcher.tt.hit_rate()
+
+class ParallelSearcher:
+    """
+    Lazy SMP search across a pool of worker processes sharing one
+    transposition table. search() returns the same tuple as Searcher.search,
+    with the node count summed over all workers.
+    """
+    def __init__(self, workers, time_budget=AI_TIME_BUDGET, max_depth=AI_MAX_DEPTH, size_mb=TT_SIZE_MB, book=None,
+                 tablebase_dir=None):
+        self.workers = workers
+        self.book = book
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.memory = shared_memory.SharedMemory(create=True, size=TranspositionTable.size_in_bytes(size_mb))
+        self.tt = TranspositionTable(size_mb, buffer=self.memory.buf)
+        self.stop_event = multiprocessing.Event()
+        self.pool = multiprocessing.Pool(workers, initializer=_smp_worker_init,
+                                         initargs=(self.memory.name, size_mb, self.stop_event, tablebase_dir))
+        self.hit_rate = 0.0
+        atexit.register(self.close)
+
+    def search(self, position):
+        start = time.time()
+        if self.book is not None:
+            move = self.book.choose(position)
+            if move is not None:
+                return move, 0, 0, 0, time.time() - start
+        self.stop_event.clear()
+        pending = [self.pool.apply_async(_smp_search, (position, helper_id, self.time_budget, self.max_depth))
+                   for helper_id in range(self.workers)]
+        results = [pending[0].get()]
+        self.stop_event.set()  # The main worker is done; helpers stop at their next time check
+        results += [result.get() for result in pending[1:]]
+
+        # Prefer the deepest completed search; the main worker wins ties
+        move, score, depth, _, _, self.hit_rate = max(results, key=lambda result: result[2])
+        nodes = sum(result[3] for result in results)
+        return move, score, depth, nodes, time.time() - start
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+            self.tt = None
+            self.memory.close()
+            self.memory.unlink()
+
+def run_smp_benchmark(depth, worker_counts):
+    """Print the time to reach a fixed depth for each worker count."""
+    positions = [START_FEN] + [fen for name, fen, _ in PERFT_SUITE if name in ("talkchess", "middlegame")]
+    baseline = None
+    for workers in worker_counts:
+        searcher = ParallelSearcher(workers, time_budget=float('inf'), max_depth=depth)
+        total_seconds, total_nodes = 0.0, 0
+        for fen in positions:
+            searcher.tt.clear()
+            _, _, _, nodes, seconds = searcher.search(Position.from_fen(fen))
+            total_seconds += seconds
+            total_nodes += nodes
+        searcher.close()
+        baseline = baseline or total_seconds
+        print(f"{workers:>2} workers: depth {depth} in {total_seconds:6.2f}s, {total_nodes} nodes "
+              f"({int(total_nodes / total_seconds)} nodes/sec), speedup {baseline / total_seconds:.2f}x")
+
+def start_background_engine(game_state):
+    """Create a BackgroundEngine, or return None where threads aren't available (e.g. in the browser)."""
+    try:
+        return BackgroundEngine(game_state.transposition_table, book=game_state.opening_book,
+                                tablebases=game_state.tablebases)
+    except RuntimeError:
+        return None
+
+# --- Perft (move generator benchmark and correctness check) ---
+
+# Standard test positions with their known leaf counts for depth 1, 2, 3...
+PERFT_SUITE = [
+    ("start", START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("talkchess", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+def perft(position, depth):
+    """Count the leaf nodes of the legal move tree to the given depth."""
+    moves = position.generate_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+def perft_divide(position, depth):
+    """Per-root-move leaf counts, for tracking down a move generator bug."""
+    counts = {}
+    for move in position.generate_moves():
+        position.make_move(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return counts
+
+def run_perft_suite(max_depth):
+    """
+    Run perft on every suite position up to max_depth, checking each count
+    against its reference value. Returns True when every count matched.
+    """
+    all_passed = True
+    total_nodes, total_seconds = 0, 0.0
+    for name, fen, expected_counts in PERFT_SUITE:
+        position = Position.from_fen(fen)
+        for depth, expected in enumerate(expected_counts[:max_depth], 1):
+            start = time.time()
+            nodes = perft(position, depth)
+            seconds = time.time() - start
+            total_nodes += nodes
+            total_seconds += seconds
+            status = "ok" if nodes == expected else f"FAIL (expected {expected})"
+            all_passed = all_passed and nodes == expected
+            print(f"{name:<11} depth {depth}: {nodes:>9} nodes {status:<6} "
+                  f"{seconds:7.2f}s {int(nodes / seconds) if seconds > 0 else 0:>9} nodes/sec")
+    if total_seconds > 0:
+        print(f"Total: {total_nodes} nodes in {total_seconds:.2f}s ({int(total_nodes / total_seconds)} nodes/sec)")
+    return all_passed
+
+def run_search_benchmark(depth, fen=None):
+    """
+    Search each suite position (or one FEN) to a fixed depth with a fresh
+    table and print nodes, time and the move-ordering statistics.
+    """
+    positions = [("fen", fen)] if fen else [(name, fen) for name, fen, _ in PERFT_SUITE]
+    total_nodes, total_seconds = 0, 0.0
+    for name, position_fen in positions:
+        searcher = Searcher(float('inf'), depth, TranspositionTable())
+        move, score, _, nodes, seconds = searcher.search(Position.from_fen(position_fen))
+        total_nodes += nodes
+        total_seconds += seconds
+        print(f"{name:<11} {move_to_uci(move) if move else '-':<6} score {score:>6}  {nodes:>8} nodes "
+              f"{seconds:6.2f}s  cutoffs {searcher.cutoffs:>6} ({searcher.first_move_cutoff_rate():.1%} first move)  "
+              f"branching factor {searcher.branching_factor():.2f}")
+    print(f"Total: {total_nodes} nodes in {total_seconds:.2f}s "
+          f"({int(total_nodes / total_seconds) if total_seconds > 0 else 0} nodes/sec)")
+
+# --- PGN reading ---
+
+PGN_RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+PGN_TOKEN = re.compile(r"\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|[^\s(){};]+")
+SAN_PIECES = {'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+
+def read_pgn_games(lines):
+    """
+    Stream games out of PGN text one at a time, e.g. from an open file, so
+    a large collection is never held in memory. Yields (headers, sans): the
+    tag pairs as a dict and the main line as a list of SAN strings.
+    """
+    headers, movetext = {}, []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('['):
+            if movetext:
+                yield headers, parse_movetext("\n".join(movetext))
+                headers, movetext = {}, []
+            name, _, value = line[1:].rstrip(']').partition(' ')
+            headers[name] = value.strip().strip('"')
+        elif line and not line.startswith('%'):
+            movetext.append(line)
+    if headers or movetext:
+        yield headers, parse_movetext("\n".join(movetext))
+
+def parse_movetext(text):
+    """The main-line SAN moves of a game's movetext, without comments, variations, NAGs or move numbers."""
+    sans = []
+    variation_depth = 0
+    for match in PGN_TOKEN.finditer(text):
+        token = match.group()
+        if token == '(':
+            variation_depth += 1
+        elif token == ')':
+            variation_depth -= 1
+        elif variation_depth == 0 and token[0] not in '{;$':
+            token = re.sub(r"^\d+\.+", "", token)  # "12.e4" or "12..."
+            if token and token not in PGN_RESULTS:
+                sans.append(token)
+    return sans
+
+def pgn_start_position(headers):
+    """The position a game starts from: its FEN tag, or the normal start."""
+    return Position.from_fen(headers.get("FEN", START_FEN))
+
+def parse_san(position, san):
+    """The legal move a SAN string such as 'Nbd7', 'exd8=Q+' or 'O-O' stands for. Raises ValueError."""
+    text = san.rstrip('+#!?')
+    moves = position.generate_moves()
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        king_square = position.king_squares[position.side]
+        to_square = king_square + (2 if len(text) == 3 else -2)
+        matches = [move for move in moves if move_from(move) == king_square and move_to(move) == to_square
+                   and position.squares[king_square] % 6 == KING]
+    else:
+        promotion = 0
+        if '=' in text:
+            text, letter = text.split('=', 1)
+            promotion = SAN_PIECES.get(letter[:1], -1)
+        elif len(text) > 2 and text[-1] in 'NBRQ':
+            text, promotion = text[:-1], SAN_PIECES[text[-1]]  # "e8Q"
+        piece_type = SAN_PIECES.get(text[:1], PAWN)
+        if piece_type != PAWN:
+            text = text[1:]
+        text = text.replace('x', '').replace(':', '')
+        target, hint = text[-2:], text[:-2]
+        if len(target) != 2 or target[0] not in FILES or target[1] not in '12345678':
+            raise ValueError(f"Can't read move {san!r}")
+        to_square = square_from_name(target)
+        matches = [move for move in moves
+                   if move_to(move) == to_square and move_promotion(move) == promotion
+                   and position.squares[move_from(move)] % 6 == piece_type
+                   and all(char in square_name(move_from(move)) for char in hint)]
+    if len(matches) != 1:
+        raise ValueError(f"{'Ambiguous' if matches else 'Illegal'} move {san!r} in {position.to_fen()}")
+    return matches[0]
+
+# --- Opening book ---
+#
+# A book file is a sorted array of fixed-width big-endian records
+# (Zobrist key, move, weight). It is memory-mapped, so opening even a large
+# book reads nothing up front, and a probe is a binary search that touches
+# only the pages it needs.
+
+BOOK_RECORD = struct.Struct(">QHH")
+BOOK_MAX_PLIES = 20  # Only the first moves of each game go into the book
+BOOK_MAX_WEIGHT = 0xFFFF
+
+class OpeningBook:
+    """A memory-mapped book file, probed by position hash."""
+    def __init__(self, path):
+        with open(path, "rb") as book_file:
+            try:
+                self.data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, ValueError, OSError):
+                self.data = book_file.read()  # No mmap here, or an empty file (which can't be mapped)
+        self.size = len(self.data) // BOOK_RECORD.size
+
+    def probe(self, key):
+        """All (move, weight) pairs stored for a position hash; empty when out of book."""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if BOOK_RECORD.unpack_from(self.data, middle * BOOK_RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        for index in range(low, self.size):
+            record_key, move, weight = BOOK_RECORD.unpack_from(self.data, index * BOOK_RECORD.size)
+            if record_key != key:
+                break
+            entries.append((move, weight))
+        return entries
+
+    def choose(self, position, rng=random):
+        """A book move for the position picked at random by weight, or None when out of book."""
+        legal_moves = position.generate_moves()  # Guards against hash collisions
+        entries = [(move, weight) for move, weight in self.probe(position.hash) if weight and move in legal_moves]
+        if not entries:
+            return None
+        moves, weights = zip(*entries)
+        return rng.choices(moves, weights)[0]
+
+def load_opening_book(path=OPENING_BOOK_FILE):
+    """Open the book file if there is one, else return None."""
+    try:
+        return OpeningBook(path)
+    except OSError:
+        return None
+
+def build_opening_book(pgn_paths, output_path, max_plies=BOOK_MAX_PLIES, min_games=1):
+    """
+    Compile the opening moves of every game in the PGN files into a book.
+    A move's weight is the number of games that played it in that position.
+    Returns the number of records written.
+    """
+    counts = {}  # (position hash, move) -> games
+    games = skipped = 0
+    for path in pgn_paths:
+        with open(path, encoding="utf-8", errors="replace") as pgn_file:
+            for headers, sans in read_pgn_games(pgn_file):
+                try:
+                    position = pgn_start_position(headers)
+                except (ValueError, IndexError, KeyError):
+                    skipped += 1
+                    continue
+                for san in sans[:max_plies]:
+                    try:
+                        move = parse_san(position, san)
+                    except ValueError:
+                        skipped += 1
+                        break  # Keep the moves before the bad one
+                    counts[position.hash, move] = counts.get((position.hash, move), 0) + 1
+                    position.make_move(move)
+                games += 1
+
+    records = sorted((key, move, min(count, BOOK_MAX_WEIGHT))
+                     for (key, move), count in counts.items() if count >= min_games)
+    with open(output_path, "wb") as book_file:
+        for record in records:
+            book_file.write(BOOK_RECORD.pack(*record))
+    print(f"{games} games ({skipped} with unreadable moves), {len(records)} book entries written to {output_path}")
+    return len(records)
+
+# --- Endgame tablebases ---
+#
+# Pawnless endings with up to four pieces (kings included) are solved
+# outright by retrograde analysis: start from the checkmates and work
+# backwards one ply at a time. A table stores one byte per position:
+# 0 for a draw, N (1..127) for a win in N plies, 128 + N for a loss in N
+# plies, and 255 for square combinations that aren't legal positions.
+#
+# The stronger side is always stored as white, and the eight symmetries of
+# the board are folded away by moving the white king into the a1-d1-d4
+# triangle. The layout is side, white king slot, then one 6-bit square per
+# other piece: white king, black king, white pieces, black pieces, each
+# side's pieces strongest first.
+
+TABLEBASE_PIECES = 4  # Most pieces (kings included) a table can hold
+TABLEBASE_DRAW = 0
+TABLEBASE_LOSS = 128
+TABLEBASE_INVALID = 255
+TABLEBASE_LETTERS = {KNIGHT: 'N', BISHOP: 'B', ROOK: 'R', QUEEN: 'Q'}
+TABLEBASE_TYPES = {letter: piece_type for piece_type, letter in TABLEBASE_LETTERS.items()}
+DEFAULT_TABLEBASES = ["KQK", "KRK", "KBNK", "KBBK", "KQKR", "KRKB", "KRKN"]
+
+def build_board_transforms():
+    """The eight symmetries of the board (rotations and reflections) as square lookup lists."""
+    transforms = []
+    for swap in (False, True):
+        for flip_rows in (False, True):
+            for flip_cols in (False, True):
+                transform = []
+                for square in range(64):
+                    row, col = square_row_col(square)
+                    if swap:
+                        row, col = col, row
+                    if flip_rows:
+                        row = 7 - row
+                    if flip_cols:
+                        col = 7 - col
+                    transform.append(square_index(row, col))
+                transforms.append(transform)
+    return transforms
+
+BOARD_TRANSFORMS = build_board_transforms()
+# The ten white king squares a table is indexed by: a1-d1-d4 triangle
+TABLEBASE_KING_SQUARES = [square for square in range(64)
+                          if square_row_col(square)[0] >= 4 and 7 - square_row_col(square)[0] <= square_row_col(square)[1] <= 3]
+TABLEBASE_KING_SLOT = [TABLEBASE_KING_SQUARES.index(square) if square in TABLEBASE_KING_SQUARES else -1
+                       for square in range(64)]
+# For each white king square, the symmetries that bring it into the triangle (two on the diagonal)
+KING_TRANSFORMS = [[transform for transform in BOARD_TRANSFORMS if TABLEBASE_KING_SLOT[transform[square]] >= 0]
+                   for square in range(64)]
+
+def material_strength(piece_types):
+    return (len(piece_types), sum(PIECE_VALUES[piece_type] for piece_type in piece_types), sorted(piece_types))
+
+def tablebase_name(white_types, black_types):
+    """Name of a material set, e.g. 'KQKR', with each side's pieces strongest first."""
+    return ('K' + ''.join(TABLEBASE_LETTERS[piece_type] for piece_type in sorted(white_types, reverse=True))
+            + 'K' + ''.join(TABLEBASE_LETTERS[piece_type] for piece_type in sorted(black_types, reverse=True)))
+
+def tablebase_key(placed, side):
+    """
+    Normalize a list of (piece, square) pairs with a side to move: the
+    stronger side becomes white (mirroring the board if needed) and the
+    squares are put in table order. Returns (name, squares, side).
+    """
+    white_types = [piece % 6 for piece, _ in placed if piece < 6 and piece != KING]
+    black_types = [piece % 6 for piece, _ in placed if piece >= 6 and piece != 6 + KING]
+    if material_strength(black_types) > material_strength(white_types):
+        placed = [((piece + 6) % 12, square ^ 56) for piece, square in placed]
+        white_types, black_types = black_types, white_types
+        side ^= 1
+    # White king, black king, white pieces strongest first, black pieces strongest first
+    placed = sorted(placed, key=lambda item: (item[0] % 6 != KING, item[0] >= 6, -(item[0] % 6)))
+    return tablebase_name(white_types, black_types), [square for _, square in placed], side
+
+def parse_tablebase_name(name):
+    """The pieces of a material name in table order, e.g. 'KQKR' -> [K, k, Q, r] as piece indexes."""
+    if name.count('K') != 2 or not name.startswith('K'):
+        raise ValueError(f"Bad material name {name!r}")
+    split = name.index('K', 1)
+    white_types = sorted((TABLEBASE_TYPES[letter] for letter in name[1:split]), reverse=True)
+    black_types = sorted((TABLEBASE_TYPES[letter] for letter in name[split + 1:]), reverse=True)
+    if len(white_types) + len(black_types) + 2 > TABLEBASE_PIECES:
+        raise ValueError(f"{name} has more than {TABLEBASE_PIECES} pieces")
+    canonical = tablebase_key([(KING, 0), (6 + KING, 63)] + [(piece_type, 0) for piece_type in white_types]
+                              + [(6 + piece_type, 0) for piece_type in black_types], WHITE)[0]
+    if canonical != name:
+        raise ValueError(f"Write {name} as {canonical} (stronger side first, pieces strongest first)")
+    return [KING, 6 + KING] + white_types + [6 + piece_type for piece_type in black_types]
+
+# Squares each piece type reaches on an empty board, for a quick "could it attack?" test
+LINE_ATTACKS = [None, KNIGHT_ATTACKS, BISHOP_RAYS, ROOK_RAYS,
+                [ROOK_RAYS[square] | BISHOP_RAYS[square] for square in range(64)], KING_ATTACKS]
+
+def piece_attacks(piece_type, square, occupied):
+    """Attack bitboard of a non-pawn piece."""
+    if piece_type == KNIGHT:
+        return KNIGHT_ATTACKS[square]
+    if piece_type == KING:
+        return KING_ATTACKS[square]
+    if piece_type == BISHOP:
+        return bishop_attacks(square, occupied)
+    if piece_type == ROOK:
+        return rook_attacks(square, occupied)
+    return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+
+class Tablebase:
+    """One material set's table: index arithmetic plus the packed bytes, if loaded."""
+    def __init__(self, name, data=None):
+        self.name = name
+        self.pieces = parse_tablebase_name(name)
+        self.types = [piece % 6 for piece in self.pieces]
+        self.colors = [piece // 6 for piece in self.pieces]
+        # Two identical pieces (e.g. KBBK) are stored with the lower square first
+        self.twins = len(self.pieces) == 4 and self.pieces[2] == self.pieces[3]
+        self.size = 2 * len(TABLEBASE_KING_SQUARES) * 64 ** (len(self.pieces) - 1)
+        self.data = data
+
+    def index(self, squares, side):
+        """Index of a position, folded by symmetry so every equivalent position shares one index."""
+        best = -1
+        for transform in KING_TRANSFORMS[squares[0]]:
+            index = (side * 10 + TABLEBASE_KING_SLOT[transform[squares[0]]]) * 64 + transform[squares[1]]
+            if len(squares) == 3:
+                index = index * 64 + transform[squares[2]]
+            else:
+                first, second = transform[squares[2]], transform[squares[3]]
+                if self.twins and first > second:
+                    first, second = second, first
+                index = (index * 64 + first) * 64 + second
+            if best < 0 or index < best:
+                best = index
+        return best
+
+    def decode(self, index):
+        """The (squares, side) stored at an index; the inverse of index() for canonical positions."""
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            index, square = divmod(index, 64)
+            squares.append(square)
+        side, slot = divmod(index, len(TABLEBASE_KING_SQUARES))
+        squares.append(TABLEBASE_KING_SQUARES[slot])
+        squares.reverse()
+        return squares, side
+
+    def attacked(self, square, by_color, squares, occupied, skip=-1):
+        """True if any piece of by_color (other than the one numbered skip) attacks the square."""
+        colors, types = self.colors, self.types
+        for number, piece_square in enumerate(squares):
+            if colors[number] != by_color or number == skip:
+                continue
+            piece_type = types[number]
+            if LINE_ATTACKS[piece_type][piece_square] >> square & 1:
+                # Sliders need a clear line; knights and kings always hit what they reach
+                if piece_type in (KNIGHT, KING) or not BETWEEN[piece_square][square] & occupied:
+                    return True
+        return False
+
+    def is_legal(self, squares, side):
+        """No two pieces share a square and the side that just moved isn't left in check."""
+        if len(set(squares)) < len(squares):
+            return False
+        occupied = 0
+        for square in squares:
+            occupied |= 1 << square
+        return not self.attacked(squares[1 - side], side, squares, occupied)
+
+    def moves(self, squares, side):
+        """
+        Yield (squares, captured) for every legal move of the side to move.
+        captured is the number of the piece taken, or -1.
+        """
+        occupied = own = 0
+        for number, square in enumerate(squares):
+            occupied |= 1 << square
+            if self.colors[number] == side:
+                own |= 1 << square
+        for number, square in enumerate(squares):
+            if self.colors[number] != side:
+                continue
+            for to_square in iterate_bits(piece_attacks(self.types[number], square, occupied) & ~own):
+                captured = squares.index(to_square) if occupied >> to_square & 1 else -1
+                after = squares[:]
+                after[number] = to_square
+                after_occupied = occupied ^ (1 << square) | (1 << to_square)
+                if not self.attacked(after[side], side ^ 1, after, after_occupied, captured):
+                    yield after, captured
+
+    def unmoves(self, squares, side):
+        """Yield the squares of every position the side not to move could have just moved from."""
+        occupied = 0
+        for square in squares:
+            occupied |= 1 << square
+        for number, square in enumerate(squares):
+            if self.colors[number] == side:
+                continue
+            for from_square in iterate_bits(piece_attacks(self.types[number], square, occupied) & ~occupied):
+                before = squares[:]
+                before[number] = from_square
+                yield before
+
+class Tablebases:
+    """The tables in a directory, opened (memory-mapped) on first use."""
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}  # Name -> Tablebase, or None when there is no file
+
+    def table(self, name):
+        if name not in self.tables:
+            try:
+                with open(os.path.join(self.directory, name + ".tb"), "rb") as table_file:
+                    try:
+                        data = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+                    except (AttributeError, ValueError, OSError):
+                        data = table_file.read()
+                self.tables[name] = Tablebase(name, data)
+            except OSError:
+                self.tables[name] = None
+        return self.tables[name]
+
+    def probe_placed(self, placed, side):
+        """Table value for (piece, square) pairs, or None if the table isn't available."""
+        if len(placed) == 2:
+            return TABLEBASE_DRAW  # Bare kings
+        name, squares, side = tablebase_key(placed, side)
+        table = self.table(name)
+        if table is None:
+            return None
+        value = table.data[table.index(squares, side)]
+        return None if value == TABLEBASE_INVALID else value
+
+    def probe(self, position):
+        """
+        Table value for a position from the side to move's view, or None when
+        it isn't covered (too many pieces, pawns, castling rights, no table).
+        """
+        if (position.occupied.bit_count() > TABLEBASE_PIECES or position.castling
+                or position.pieces[PAWN] or position.pieces[6 + PAWN]):
+            return None
+        squares = position.squares
+        placed = [(squares[square], square) for square in iterate_bits(position.occupied)]
+        return self.probe_placed(placed, position.side)
+
+def load_tablebases(directory=TABLEBASE_DIR):
+    """The tablebase directory if it exists, else None."""
+    return Tablebases(directory) if os.path.isdir(directory) else None
+
+def tablebase_score(value, ply):
+    """Search score for a table value found at the given ply."""
+    if value == TABLEBASE_DRAW:
+        return 0
+    if value < TABLEBASE_LOSS:
+        return MATE_SCORE - ply - value
+    return -MATE_SCORE + ply + value - TABLEBASE_LOSS
+
+def tablebase_dependencies(name):
+    """Names of the smaller tables captures in this one lead to (excluding bare kings)."""
+    pieces = parse_tablebase_name(name)
+    names = set()
+    for number in range(2, len(pieces)):
+        remaining = [(piece, 0) for index, piece in enumerate(pieces) if index != number]
+        if len(remaining) > 2:
+            names.add(tablebase_key(remaining, WHITE)[0])
+    return names
+
+_tablebase = None  # Per-worker table being classified
+_tablebase_probes = None  # Per-worker view of the finished smaller tables
+
+def _tablebase_worker_init(name, directory):
+    global _tablebase, _tablebase_probes
+    _tablebase = Tablebase(name)
+    _tablebase_probes = Tablebases(directory)
+
+def _tablebase_classify(start, stop):
+    """
+    First pass over a slice of a table. For each position work out whether
+    it's legal, count its distinct non-capturing successors, and score the
+    captures from the smaller tables. Returns (states, counts, loss_plies,
+    seeds) where seeds are (index, ply) pairs already known to be won or lost.
+    """
+    table, probes = _tablebase, _tablebase_probes
+    states = bytearray(stop - start)
+    counts = bytearray(stop - start)
+    loss_plies = bytearray(stop - start)
+    seeds = []
+    for index in range(start, stop):
+        squares, side = table.decode(index)
+        if not table.is_legal(squares, side) or table.index(squares, side) != index:
+            states[index - start] = TABLEBASE_INVALID
+            continue
+        children = set()
+        escapes = 0  # Captures that don't lose: a draw, or a win
+        has_moves = False
+        win_ply = loss_ply = 0
+        for after, captured in table.moves(squares, side):
+            has_moves = True
+            if captured < 0:
+                children.add(table.index(after, side ^ 1))
+                continue
+            placed = [(table.pieces[number], square) for number, square in enumerate(after) if number != captured]
+            value = probes.probe_placed(placed, side ^ 1)
+            if value is None:
+                raise RuntimeError(f"{table.name} needs a missing smaller table")
+            if value >= TABLEBASE_LOSS:
+                ply = value - TABLEBASE_LOSS + 1
+                win_ply = min(win_ply, ply) if win_ply else ply
+                escapes = 1
+            elif value == TABLEBASE_DRAW:
+                escapes = 1
+            else:
+                loss_ply = max(loss_ply, value + 1)
+        counts[index - start] = min(len(children) + escapes, 255)
+        loss_plies[index - start] = loss_ply
+        if not has_moves:
+            if table.attacked(squares[side], side ^ 1, squares, sum(1 << square for square in squares)):
+                seeds.append((index, 0))  # Checkmated
+        elif win_ply:
+            seeds.append((index, win_ply))
+        elif not children and not escapes:
+            seeds.append((index, loss_ply))  # Every move is a losing capture
+    return states, counts, loss_plies, seeds
+
+def solve_tablebase(name, directory, workers):
+    """
+    Generate one table and write it to the directory. The classification
+    pass runs in a process pool; the backward search from the mates then
+    runs here, one ply at a time, so every distance is the shortest one.
+    """
+    start_time = time.time()
+    table = Tablebase(name)
+    chunk = table.size // (2 * len(TABLEBASE_KING_SQUARES))
+    with multiprocessing.Pool(workers, initializer=_tablebase_worker_init, initargs=(name, directory)) as pool:
+        results = pool.starmap(_tablebase_classify, [(start, start + chunk) for start in range(0, table.size, chunk)])
+
+    values, counts, loss_plies = bytearray(), bytearray(), bytearray()
+    frontier = [[] for _ in range(TABLEBASE_INVALID)]  # Positions to settle at each ply
+    for states, chunk_counts, chunk_loss_plies, seeds in results:
+        values += states
+        counts += chunk_counts
+        loss_plies += chunk_loss_plies
+        for index, ply in seeds:
+            frontier[ply].append(index)
+
+    # Values are still 0 for every unsettled legal position
+    longest = 0
+    for ply in range(TABLEBASE_INVALID - 1):
+        won = ply % 2 == 1  # Wins take an odd number of plies, losses an even number
+        for index in frontier[ply]:
+            if values[index]:
+                continue  # Already settled, and by a shorter line
+            if won and ply >= TABLEBASE_LOSS:
+                raise ValueError(f"{name}: a win in {ply} plies doesn't fit in a table byte")
+            values[index] = ply if won else TABLEBASE_LOSS + ply
+            longest = ply
+            squares, side = table.decode(index)
+            for previous in {table.index(before, side ^ 1) for before in table.unmoves(squares, side)}:
+                if values[previous]:
+                    continue
+                if not won:
+                    frontier[ply + 1].append(previous)  # A move into a lost position wins
+                else:
+                    # One more move found to lose; the position is lost when none are left
+                    counts[previous] -= 1
+                    loss_plies[previous] = max(loss_plies[previous], ply + 1)
+                    if counts[previous] == 0:
+                        frontier[loss_plies[previous]].append(previous)
+        frontier[ply] = None
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name + ".tb"), "wb") as table_file:
+        table_file.write(values)
+    wins = sum(1 for value in values if 0 < value < TABLEBASE_LOSS)
+    losses = sum(1 for value in values if TABLEBASE_LOSS <= value < TABLEBASE_INVALID)
+    draws = len(values) - wins - losses - values.count(TABLEBASE_INVALID)
+    print(f"{name}: {wins + losses + draws} positions ({wins} won, {draws} drawn, {losses} lost), "
+          f"longest mate {longest} plies, {time.time() - start_time:.1f}s")
+
+def build_tablebases(names, directory=TABLEBASE_DIR, workers=None):
+    """Generate the named tables and any smaller ones they depend on that aren't on disk yet."""
+    needed, pending = set(), list(names)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            parse_tablebase_name(name)  # Raises ValueError for a bad name
+            needed.add(name)
+            pending.extend(dependency for dependency in tablebase_dependencies(name)
+                           if not os.path.exists(os.path.join(directory, dependency + ".tb")))
+    for name in sorted(needed, key=lambda name: (len(name), name)):
+        solve_tablebase(name, directory, workers or multiprocessing.cpu_count())
+
+# --- Self-play tournaments ---
+#
+# Engines are described by short specs so they can be sent to worker processes:
+#   random      - plays a uniformly random legal move
+#   time:0.05   - searches each move for the given number of seconds
+#   depth:3     - searches each move to a fixed depth
+
+TOURNAMENT_TT_SIZE_MB = 4  # Per engine per game; many games run at once
+TOURNAMENT_MAX_PLIES = 300  # Games still running after this many plies are scored as draws
+
+def make_player(spec, rng):
+    """Turn an engine spec into a function that picks a move for a position."""
+    kind, _, value = spec.partition(":")
+    if kind == "random":
+        return lambda position: rng.choice(position.generate_moves())
+    if kind == "time":
+        searcher = Searcher(float(value), transposition_table=TranspositionTable(TOURNAMENT_TT_SIZE_MB))
+    elif kind == "depth":
+        searcher = Searcher(float('inf'), int(value), transposition_table=TranspositionTable(TOURNAMENT_TT_SIZE_MB))
+    else:
+        raise ValueError(f"Unknown engine spec: {spec!r}")
+    return lambda position: searcher.search(position)[0]
+
+def game_result(position):
+    """
+    Score of a finished game from white's point of view (1, 0.5 or 0), or
+    None while it is still going.
+    """
+    if not position.generate_moves():
+        if not position.in_check():
+            return 0.5  # Stalemate
+        return 0.0 if position.side == WHITE else 1.0
+    kings = position.pieces[WHITE * 6 + KING] | position.pieces[BLACK * 6 + KING]
+    if position.occupied == kings or position.is_rule_draw():
+        return 0.5  # Bare kings, repetition or fifty moves
+    return None
+
+def play_tournament_game(task):
+    """
+    Play one headless game. The task is (white spec, black spec, seed,
+    opening plies, max plies); the result is white's score.
+    """
+    white_spec, black_spec, seed, opening_plies, max_plies = task
+    rng = random.Random(seed)
+    position = Position.from_fen(START_FEN)
+    # A few random opening moves so repeated games between the same engines differ
+    for _ in range(opening_plies):
+        position.make_move(rng.choice(position.generate_moves()))
+    players = [make_player(white_spec, rng), make_player(black_spec, rng)]
+
+    while len(position.history) < max_plies:
+        result = game_result(position)
+        if result is not None:
+            return result
+        position.make_move(players[position.side](position))
+    return 0.5
+
+def elo_difference(wins, draws, losses):
+    """
+    Elo difference implied by a score, with its 95% confidence interval.
+    Returns (elo, low, high). Scores are kept half a game away from 0% and
+    100%, so a clean sweep gives a large but finite difference.
+    """
+    games = wins + draws + losses
+    lowest, highest = 0.5 / games, 1 - 0.5 / games
+
+    def to_elo(score):
+        score = min(max(score, lowest), highest)
+        return -400 * math.log10(1 / score - 1)
+
+    score = min(max((wins + draws / 2) / games, lowest), highest)
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return to_elo(score), to_elo(score - margin), to_elo(score + margin)
+
+def run_tournament(engine_a, engine_b, games, workers, opening_plies=4, max_plies=TOURNAMENT_MAX_PLIES, seed=1):
+    """
+    Play engine_a against engine_b in a process pool, swapping colors every
+    game and reusing each random opening for both colors. Prints the running
+    tally and the Elo difference of engine_a over engine_b.
+    """
+    tasks = []
+    for game in range(games):
+        opening_seed = seed * 100003 + game // 2
+        if game % 2 == 0:
+            tasks.append((engine_a, engine_b, opening_seed, opening_plies, max_plies))
+        else:
+            tasks.append((engine_b, engine_a, opening_seed, opening_plies, max_plies))
+
+    wins = draws = losses = 0
+    start = time.time()
+    with multiprocessing.Pool(workers) as pool:
+        for game, white_score in enumerate(pool.imap(play_tournament_game, tasks)):
+            score = white_score if game % 2 == 0 else 1 - white_score
+            if score == 1:
+                wins += 1
+            elif score == 0:
+                losses += 1
+            else:
+                draws += 1
+            if (game + 1) % max(1, games // 10) == 0 or game + 1 == games:
+                print(f"{game + 1}/{games} games: +{wins} ={draws} -{losses} ({time.time() - start:.0f}s)")
+
+    elo, low, high = elo_difference(wins, draws, losses)
+    print(f"{engine_a} vs {engine_b}: {elo:+.0f} Elo (95% interval {low:+.0f} to {high:+.0f})")
+    return wins, draws, losses
+
+# --- Batch analysis ---
+#
+# Games stream in from PGN (or single positions from FEN/EPD files, one per
+# line) and are handed to a worker pool a batch at a time, so memory stays
+# flat however big the input is. Each worker replays its game with the
+# engine's make_move and searches every position on the way, writing one
+# JSON line per position.
+
+ANALYSIS_TT_SIZE_MB = 16  # Per worker, kept across the positions of a game
+ANALYSIS_BATCH_GAMES = 16  # Games in flight per worker
+MATE_THRESHOLD = MATE_SCORE - 1000  # Scores beyond this are forced mates
+
+_analysis_searcher = None  # Per-worker searcher, reused for every game
+
+def _analysis_worker_init(time_budget, depth):
+    global _analysis_searcher
+    _analysis_searcher = Searcher(time_budget, depth, TranspositionTable(ANALYSIS_TT_SIZE_MB),
+                                  tablebases=load_tablebases())
+
+def read_analysis_input(path):
+    """Yield (headers, SAN moves) for each game of a PGN file, or for each line of a FEN/EPD file."""
+    with open(path, encoding="utf-8", errors="replace") as input_file:
+        if path.lower().endswith(".pgn"):
+            yield from read_pgn_games(input_file)
+        else:
+            for line in input_file:
+                fields = line.split()
+                if fields:
+                    # EPD lines carry operations instead of the move counters
+                    yield {"FEN": " ".join(fields[:6] if len(fields) >= 6 and fields[4].isdigit() else fields[:4])}, []
+
+def analysis_record(game, ply, position, searcher):
+    """Search one position and describe the result as a dict for the JSON output."""
+    move, score, depth, nodes, seconds = searcher.search(position)
+    record = {"game": game, "ply": ply, "fen": position.to_fen()}
+    if depth == 0:
+        # The time ran out before depth 1: the move and score are placeholders, not an evaluation
+        record.update({"depth": 0, "nodes": nodes, "error": "no depth completed"})
+        return record
+    if position.side == BLACK:
+        score = -score  # Report scores from white's point of view
+    record.update({"best": move_to_uci(move) if move else None, "depth": depth, "nodes": nodes})
+    if abs(score) >= MATE_THRESHOLD:
+        plies = MATE_SCORE - abs(score)
+        record["mate"] = plies if score > 0 else -plies  # Plies to mate; negative when black mates
+    else:
+        record["score"] = score
+    return record
+
+def analyse_game(task):
+    """Replay one game and return its JSON lines, stopping at the first move that can't be read."""
+    game, headers, sans = task
+    searcher = _analysis_searcher
+    searcher.tt.clear()
+    lines = []
+    try:
+        position = pgn_start_position(headers)
+    except (ValueError, IndexError, KeyError):
+        return [json.dumps({"game": game, "error": f"bad FEN {headers.get('FEN')!r}"})]
+    for ply in range(len(sans) + 1):
+        if position.generate_moves():
+            record = analysis_record(game, ply, position, searcher)
+            if ply < len(sans):
+                record["played"] = sans[ply]
+            lines.append(json.dumps(record))
+        if ply == len(sans):
+            break
+        try:
+            position.make_move(parse_san(position, sans[ply]))
+        except ValueError as error:
+            lines.append(json.dumps({"game": game, "ply": ply, "error": str(error)}))
+            break
+    return lines
+
+def run_analysis(paths, output, depth=None, time_budget=None, workers=None):
+    """
+    Analyse every position of every game in the input files and write JSON
+    lines to output (a path, or '-' for stdout). With neither depth nor time
+    given, each position gets the GUI's time budget.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    if time_budget is None:
+        time_budget = float('inf') if depth else AI_TIME_BUDGET
+    tasks = ((game, headers, sans) for game, (headers, sans)
+             in enumerate(game for path in paths for game in read_analysis_input(path)))
+    games = positions = 0
+    start = time.time()
+    output_file = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    try:
+        with multiprocessing.Pool(workers, initializer=_analysis_worker_init,
+                                  initargs=(time_budget, depth or AI_MAX_DEPTH)) as pool:
+            while True:
+                # Pool.imap would read the whole input up front; feed it a batch at a time instead
+                batch = [task for _, task in zip(range(workers * ANALYSIS_BATCH_GAMES), tasks)]
+                if not batch:
+                    break
+                for lines in pool.imap(analyse_game, batch):
+                    for line in lines:
+                        output_file.write(line + "\n")
+                    positions += len(lines)
+                games += len(batch)
+                output_file.flush()
+                print(f"{games} games, {positions} positions ({time.time() - start:.0f}s)", file=sys.stderr)
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+    return games, positions
+
+# --- Headless command line tools ---
+
+def run_tools(argv):
+    """Entry point for the command line tools that don't need a canvas."""
+    parser = argparse.ArgumentParser(prog="main.py", description="Headless chess engine tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    perft_parser = commands.add_parser("perft", help="Count move generator leaf nodes and check them.")
+    perft_parser.add_argument("--depth", type=int, default=3, help="Maximum depth (default 3).")
+    perft_parser.add_argument("--fen", help="Run a single position instead of the test suite.")
+    perft_parser.add_argument("--divide", action="store_true", help="With --fen, print counts per root move.")
+
+    smp_parser = commands.add_parser("smp-bench", help="Time a fixed-depth search as worker processes are added.")
+    smp_parser.add_argument("--depth", type=int, default=4, help="Search depth (default 4).")
+    smp_parser.add_argument("--workers", default=None,
+                            help="Comma-separated worker counts (default 1,2,4,... up to the CPU count).")
+
+    book_parser = commands.add_parser("book-build", help="Compile an opening book from PGN files.")
+    book_parser.add_argument("pgn", nargs="+", help="PGN files to read.")
+    book_parser.add_argument("--output", default=OPENING_BOOK_FILE, help=f"Book file (default {OPENING_BOOK_FILE}).")
+    book_parser.add_argument("--max-plies", type=int, default=BOOK_MAX_PLIES,
+                             help=f"Moves per game to include (default {BOOK_MAX_PLIES}).")
+    book_parser.add_argument("--min-games", type=int, default=1,
+                             help="Leave out moves played in fewer games than this (default 1).")
+
+    tablebase_parser = commands.add_parser("tablebase-build", help="Generate endgame tablebases.")
+    tablebase_parser.add_argument("materials", nargs="*", default=DEFAULT_TABLEBASES,
+                                  help=f"Material sets such as KQK or KQKR (default {' '.join(DEFAULT_TABLEBASES)}).")
+    tablebase_parser.add_argument("--dir", default=TABLEBASE_DIR, help=f"Output directory (default {TABLEBASE_DIR}).")
+    tablebase_parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                                  help="Worker processes (default: CPU count).")
+
+    analyse_parser = commands.add_parser("analyse", help="Evaluate every position of PGN games or FEN/EPD files.")
+    analyse_parser.add_argument("inputs", nargs="+", help="PGN files (.pgn), or files with one FEN per line.")
+    analyse_parser.add_argument("--output", default="-", help="JSON lines file (default: stdout).")
+    analyse_parser.add_argument("--depth", type=int, help="Search each position to this depth.")
+    analyse_parser.add_argument("--time", type=float,
+                                help=f"Seconds per position (default {AI_TIME_BUDGET} unless --depth is given).")
+    analyse_parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                                help="Worker processes (default: CPU count).")
+
+    search_parser = commands.add_parser("search-bench",
+                                        help="Search the suite to a fixed depth and print cutoff statistics.")
+    search_parser.add_argument("--depth", type=int, default=4, help="Search depth (default 4).")
+    search_parser.add_argument("--fen", help="Search a single position instead of the suite.")
+
+    tournament_parser = commands.add_parser("tournament", help="Play engine-vs-engine games and estimate Elo.")
+    tournament_parser.add_argument("engine_a", help="Engine spec, e.g. time:0.05, depth:2 or random.")
+    tournament_parser.add_argument("engine_b", help="Opponent engine spec.")
+    tournament_parser.add_argument("--games", type=int, default=100, help="Number of games (default 100).")
+    tournament_parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                                   help="Worker processes (default: CPU count).")
+    tournament_parser.add_argument("--opening-plies", type=int, default=4,
+                                   help="Random moves played before the engines take over (default 4).")
+    tournament_parser.add_argument("--max-plies", type=int, default=TOURNAMENT_MAX_PLIES,
+                                   help=f"Adjudicate a draw after this many plies (default {TOURNAMENT_MAX_PLIES}).")
+    tournament_parser.add_argument("--seed", type=int, default=1, help="Seed for the random openings.")
+
+    args = parser.parse_args(argv)
+    if args.command == "tournament":
+        run_tournament(args.engine_a, args.engine_b, args.games, args.workers,
+                       args.opening_plies, args.max_plies, args.seed)
+    elif args.command == "book-build":
+        build_opening_book(args.pgn, args.output, args.max_plies, args.min_games)
+    elif args.command == "tablebase-build":
+        build_tablebases(args.materials, args.dir, args.workers)
+    elif args.command == "analyse":
+        run_analysis(args.inputs, args.output, args.depth, args.time, args.workers)
+    elif args.command == "search-bench":
+        run_search_benchmark(args.depth, args.fen)
+    elif args.command == "smp-bench":
+        if args.workers:
+            worker_counts = [int(count) for count in args.workers.split(",")]
+        else:
+            worker_counts = [1]
+            while worker_counts[-1] * 2 <= multiprocessing.cpu_count():
+                worker_counts.append(worker_counts[-1] * 2)
+        run_smp_benchmark(args.depth, worker_counts)
+    elif args.command == "perft":
+        if args.fen is None:
+            return 0 if run_perft_suite(args.depth) else 1
+        position = Position.from_fen(args.fen)
+        if args.divide:
+            for move, count in sorted(perft_divide(position, args.depth).items()):
+                print(f"{move}: {count}")
+        start = time.time()
+        nodes = perft(position, args.depth)
+        seconds = time.time() - start
+        print(f"depth {args.depth}: {nodes} nodes in {seconds:.2f}s "
+              f"({int(nodes / seconds) if seconds > 0 else 0} nodes/sec)")
+    return 0
+
 # --- Main game logic ---
 
 def main():
@@ -539,6 +2726,7 @@ def main():
     chosen_scheme_index = -1
     game_state = GameState()
     vs_ai = False  # Flag to determine if playing against AI
+    engine = None  # Background search thread in vs AI mode
 
     # Main application loop
     while True:
@@ -637,18 +2825,20 @@ def main():
                         canvas.clear()
                         current_game_state = GAME_ACTIVE
                         game_state = GameState()  # Reset game state
+                        # Draw the board once; from now on only changed pieces are redrawn
+                        light_color, dark_color = COLOR_SCHEMES[chosen_scheme_index]
+                        draw_chessboard_squares(canvas, light_color, dark_color)
+                        create_highlight_pool(canvas, game_state)
+                        draw_pieces(canvas, game_state)
+                        if vs_ai:
+                            if engine is not None:
+                                engine.stop()
+                            engine = start_background_engine(game_state)
+                            if engine is not None:
+                                engine.ponder(game_state.position)
                         break
 
         elif current_game_state == GAME_ACTIVE:
-            # Draw the board once
-            if chosen_scheme_index != -1:
-                light_color, dark_color = COLOR_SCHEMES[chosen_scheme_index]
-            else:
-                light_color, dark_color = "white", "black"
-            
-            draw_chessboard_squares(canvas, light_color, dark_color)
-            draw_pieces(canvas, game_state)
-            
             # Display current player
             player_text = f"Current Player: {game_state.current_player.capitalize()}"
             #draw_centered_text(canvas, CANVAS_WIDTH / 2, CANVAS_HEIGHT - 30, player_text, 16, "#333333")
@@ -657,27 +2847,66 @@ def main():
             mode_text = "vs AI" if vs_ai else "vs Human"
             #draw_centered_text(canvas, CANVAS_WIDTH / 2, CANVAS_HEIGHT - 10, mode_text, 12, "#666666")
             
-            if game_state.is_game_over:
-                winner_text = f"Game Over 💀 {game_state.winner} Wins"
-                draw_centered_text(canvas, CANVAS_WIDTH / 2-30, CANVAS_HEIGHT /2 , winner_text, 30, "red")
+            if game_state.is_game_over and game_state.game_over_text_id is None:
+                if game_state.winner:
+                    winner_text = f"Game Over 💀 {game_state.winner} Wins"
+                else:
+                    winner_text = "Game Over 🤝 Draw"
+                game_state.game_over_text_id = draw_centered_text(canvas, CANVAS_WIDTH / 2-30, CANVAS_HEIGHT /2 , winner_text, 30, "red")
+            
+            # Undo the last move (and the AI's reply to it in vs AI mode)
+            key = canvas.get_last_key_press()
+            if key in UNDO_KEYS:
+                clear_highlights(canvas, game_state)
+                game_state.selected_piece = None
+                game_state.possible_moves = set()
+                if engine is not None:
+                    engine.stop()
+                undo_move(game_state)
+                if vs_ai and game_state.current_player == 'black':
+                    undo_move(game_state)
+                if engine is not None:
+                    engine.ponder(game_state.position)
+                if game_state.game_over_text_id is not None:
+                    canvas.delete(game_state.game_over_text_id)
+                    game_state.game_over_text_id = None
+                draw_pieces(canvas, game_state)
             
-            # Handle clicks
+            # Handle clicks (the board is the AI's while it is Black's turn)
             click = canvas.get_last_click()
-            if click and not game_state.is_game_over:
+            ai_to_move = vs_ai and game_state.current_player == 'black'
+            if click and not game_state.is_game_over and not ai_to_move:
                 click_x, click_y = click
                 square = get_square_from_click(click_x, click_y)
                 if square:
                     row, col = square
+                    moves_played = len(game_state.position.history)
                     handle_square_click(canvas, game_state, row, col)
+                    if (engine is not None and len(game_state.position.history) != moves_played
+                            and not game_state.is_game_over):
+                        engine.think(game_state.position)
             
             # AI move (if vs AI and it's AI's turn)
             if vs_ai and game_state.current_player == 'black' and not game_state.is_game_over:
-                time.sleep(1)  # Brief pause for AI "thinking"
-                if make_ai_move(game_state):
-                    # Removed canvas.clear() here. The main loop will handle the redraw.
-                    pass 
+                if engine is None:
+                    # No threads available: search right here in the UI loop
+                    clear_selection(canvas, game_state)
+                    if make_ai_move(game_state):
+                        draw_pieces(canvas, game_state)
+                else:
+                    result = engine.poll(game_state.position.hash)
+                    if result is not None and result[0] is not None:
+                        move, score, depth, nodes, seconds, hit_rate = result
+                        report_search(depth, score, nodes, seconds, hit_rate)
+                        clear_selection(canvas, game_state)
+                        play_engine_move(game_state, move)
+                        draw_pieces(canvas, game_state)
+                        if not game_state.is_game_over:
+                            engine.ponder(game_state.position)
 
         time.sleep(0.01)
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(run_tools(sys.argv[1:]))
     main()
@@ -0,0 +1,20 @@
+from main import Position, Searcher, TranspositionTable, analysis_record
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+
+def test_unfinished_search_is_reported_as_an_error():
+    searcher = Searcher(1e-6, transposition_table=TranspositionTable())
+    record = analysis_record(1, 0, Position.from_fen(KIWIPETE), searcher)
+    assert record["depth"] == 0
+    assert record["error"] == "no depth completed"
+    assert "best" not in record and "score" not in record
+
+
+def test_finished_search_has_a_move_and_score():
+    searcher = Searcher(5, 2, TranspositionTable())
+    record = analysis_record(1, 0, Position.from_fen(KIWIPETE), searcher)
+    assert record["depth"] == 2
+    assert record["best"] is not None
+    assert "score" in record or "mate" in record
+    assert "error" not in record
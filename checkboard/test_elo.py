@@ -0,0 +1,17 @@
+import math
+
+from main import elo_difference
+
+
+def test_even_score_is_zero():
+    elo, low, high = elo_difference(5, 0, 5)
+    assert elo == 0
+    assert low < 0 < high
+
+
+def test_clean_sweep_is_finite():
+    for wins, losses in ((10, 0), (0, 10)):
+        elo, low, high = elo_difference(wins, 0, losses)
+        assert all(math.isfinite(value) for value in (elo, low, high))
+        assert low <= elo <= high
+        assert (elo > 0) == (wins > 0)